@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from src.defines.ProviderType import ProviderType
+from src.defines.RenameStrategy import RenameStrategy
+from src.benchmark.FakeProviderService import FakeProviderServer, start_git_daemon
+from src.service.IOService import get_directory_size
+from src.service.ProviderService import build_pooled_provider
+from src.benchmark.SyntheticRepoService import create_synthetic_repo, copy_synthetic_repo
+
+'''
+Reproducible end to end benchmark of build_model and clone_repos against a local stub provider serving synthetic repos.
+
+python -m src.benchmark --users 2 --organizations 3 --repos 10 --file-size 65536 --output bench.json
+'''
+
+
+def build_benchmark_argument_parser():
+    parser = argparse.ArgumentParser(description="Benchmark discovery and cloning against a local fake provider")
+    parser.add_argument("--users", help="Number of users to back up.", type=int, default=1)
+    parser.add_argument("--organizations", help="Number of organizations every user is a member of.", type=int,
+                        default=2)
+    parser.add_argument("--repos", help="Number of repositories of each user and organization.", type=int,
+                        default=10)
+    parser.add_argument("--commits", help="Number of commits of each repository.", type=int, default=10)
+    parser.add_argument("--files", help="Number of files modified by each commit.", type=int, default=4)
+    parser.add_argument("--file-size", help="Size in bytes of each file.", type=int, default=4096, dest="file_size")
+    parser.add_argument("--transport", help="How the synthetic repositories are served.", type=str, default="http",
+                        choices=["http", "file", "daemon"])
+    parser.add_argument("--rate-limit", help="API requests allowed per token before answering with rate limit errors.",
+                        type=int, dest="rate_limit")
+    parser.add_argument("--rate-limit-window", help="Seconds after which the API request budget of every token resets.",
+                        type=int, default=60, dest="rate_limit_window")
+    parser.add_argument("--tokens", help="Number of tokens in the pool used against the fake provider.", type=int,
+                        default=1)
+    parser.add_argument("--seed", help="Seed of the synthetic content.", type=int, default=0)
+    parser.add_argument("--work-directory", help="Directory for the synthetic repos and the backup. Temporary if not "
+                                                 "supplied.", type=str, dest="work_directory", metavar="DIRECTORY_PATH")
+    parser.add_argument("--keep", help="Do not remove the work directory afterwards.", action="store_true",
+                        default=False)
+    parser.add_argument("-o", "--output", help="Append the JSON results to this file instead of printing them.",
+                        type=str, metavar="FILE_PATH")
+    return parser
+
+
+def generate_repositories(args, repos_root):
+    users = [f"user{i}" for i in range(args.users)]
+    organizations = [f"org{i}" for i in range(args.organizations)]
+    repositories = {owner: [f"repo{i}" for i in range(args.repos)] for owner in users + organizations}
+
+    template_path = os.path.join(repos_root, ".template.git")
+    create_synthetic_repo(template_path, args.commits, args.files, args.file_size, args.seed)
+    for owner, names in repositories.items():
+        for name in names:
+            copy_synthetic_repo(template_path, os.path.join(repos_root, owner, name + ".git"))
+    return users, organizations, repositories
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing is listening on port {port}")
+
+
+def run_backup(provider_url, tokens, usernames, backup_folder, link_template, results):
+    """Runs discovery and cloning in a fresh process, so that its peak RSS is not mixed with the stub server's."""
+    # Imported here so that the import time is not part of the measurements of the parent. main only imports the
+    # provider services when they are first built, so they are imported before the timer starts as well
+    from src.main import build_model, clone_repos
+    import src.service.GitHubService  # noqa: F401
+
+    args = argparse.Namespace(usernames=usernames, backup_name="benchmark", flatten_directories=[],
+                              rename_strategy=RenameStrategy.SHORTEST_SYSTEMATIC)
+    providers = [build_pooled_provider(ProviderType.GITHUB, provider_url,
+                                       [f"benchmark-token-{i}" for i in range(tokens)])]
+
+    start = time.monotonic()
+    model = build_model(args, providers)
+    discovery_seconds = time.monotonic() - start
+
+    if link_template:
+        for repository in model.values():
+            repository.link = link_template.format(organization=repository.organization, name=repository.name)
+
+    start = time.monotonic()
+    clone_repos(model, backup_folder)
+    clone_seconds = time.monotonic() - start
+
+    results.put({
+        "repositories": len(model),
+        "discovery_seconds": discovery_seconds,
+        "clone_seconds": clone_seconds,
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+
+
+def get_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args):
+    work_directory = args.work_directory or tempfile.mkdtemp(prefix="github-backup-benchmark-")
+    repos_root = os.path.join(work_directory, "repos")
+    backup_folder = os.path.join(work_directory, "backup")
+    for directory in (repos_root, backup_folder):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+    daemon = None
+    server = None
+    try:
+        start = time.monotonic()
+        users, organizations, repositories = generate_repositories(args, repos_root)
+        generation_seconds = time.monotonic() - start
+
+        server = FakeProviderServer(users, organizations, repositories, repos_root, args.rate_limit,
+                                    args.rate_limit_window).start()
+        link_template = None
+        if args.transport == "file":
+            link_template = "file://" + repos_root + "/{organization}/{name}.git"
+        elif args.transport == "daemon":
+            port = get_free_port()
+            daemon = start_git_daemon(repos_root, port)
+            wait_for_port(port)
+            link_template = f"git://127.0.0.1:{port}" + "/{organization}/{name}.git"
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=run_backup,
+                                  args=(server.url, args.tokens, users, backup_folder, link_template, results))
+        process.start()
+        while True:
+            try:
+                result = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"The benchmark run failed with exit code {process.exitcode}")
+        process.join()
+
+        received_bytes = get_directory_size(backup_folder)
+        result.update({
+            "revision": get_revision(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "configuration": {key: value for key, value in vars(args).items()
+                              if key not in ("output", "keep", "work_directory")},
+            "generation_seconds": generation_seconds,
+            "backup_bytes": received_bytes,
+            "clone_throughput_bytes_per_second": received_bytes / result["clone_seconds"]
+            if result["clone_seconds"] else None,
+            "clone_throughput_repositories_per_second": result["repositories"] / result["clone_seconds"]
+            if result["clone_seconds"] else None,
+            "api_calls": sum(server.api_calls.values()),
+            "api_calls_per_endpoint": dict(server.api_calls),
+        })
+        return result
+    finally:
+        if server:
+            server.stop()
+        if daemon:
+            daemon.terminate()
+            daemon.wait()
+        if not args.keep and not args.work_directory:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+
+def main():
+    args = build_benchmark_argument_parser().parse_args()
+    result = benchmark(args)
+    if args.output:
+        # One JSON document per line, so that runs of different commits can be accumulated and compared
+        with open(args.output, "a") as file:
+            file.write(json.dumps(result) + "\n")
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import subprocess
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Suffixes of the smart HTTP git protocol requests, served by git http-backend instead of the REST API
+GIT_SUFFIXES = ("/info/refs", "/git-upload-pack")
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    """Local stub of the subset of the GitHub REST API used by GitHubService that also serves repos over smart HTTP.
+
+    Owners are either users or organizations. Every user is a member of every organization, and each owner has the
+    repositories listed in repositories, which are served from repos_root/<owner>/<repo>.git. Each repository has
+    issues issues, updated a minute apart, and no other metadata.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, users: List[str], organizations: List[str], repositories: Dict[str, List[str]],
+                 repos_root: str, rate_limit: Optional[int] = None, rate_limit_window: int = 60, port: int = 0,
+                 issues: int = 0):
+        super().__init__(("127.0.0.1", port), _FakeProviderHandler)
+        self.users = users
+        self.organizations = organizations
+        self.repositories = repositories
+        self.repos_root = repos_root
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.issues = issues
+        self.rate_limit_reset = int(time.time()) + rate_limit_window
+        self.remaining = {}
+        self.api_calls = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-provider", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def consume_request(self, token: str, endpoint: str):
+        """Counts an API call and returns the remaining budget of token, negative if it is exhausted."""
+        with self.lock:
+            self.api_calls[endpoint] += 1
+            if self.rate_limit is None:
+                return 5000
+            if time.time() >= self.rate_limit_reset:
+                self.rate_limit_reset = int(time.time()) + self.rate_limit_window
+                self.remaining.clear()
+            remaining = self.remaining.get(token, self.rate_limit) - 1
+            self.remaining[token] = max(remaining, 0)
+            return remaining
+
+
+class _FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.endswith(GIT_SUFFIXES):
+            self.serve_git()
+        else:
+            self.serve_api()
+
+    def do_POST(self):
+        self.serve_git()
+
+    def serve_api(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        parts = [part for part in parsed.path.split("/") if part]
+        token = self.headers.get("Authorization", "").split(" ")[-1]
+        endpoint = "/".join("{}" if part in self.server.repositories or (parts[0] == "repos" and index == 2) else part
+                            for index, part in enumerate(parts))
+
+        remaining = self.server.consume_request(token, endpoint)
+        if remaining < 0:
+            self.send_json(403, {"message": "API rate limit exceeded"}, 0)
+            return
+
+        if parts == ["rate_limit"]:
+            limit = self.server.rate_limit or 5000
+            core = {"limit": limit, "remaining": remaining, "reset": self.server.rate_limit_reset, "used": 0}
+            self.send_json(200, {"resources": {"core": core}, "rate": core}, remaining)
+        elif parts == ["user"]:
+            self.send_json(200, self.owner_json(self.server.users[0]), remaining)
+        elif parts == ["user", "orgs"]:
+            self.send_page([self.owner_json(org) for org in self.server.organizations], query, remaining)
+        elif parts == ["user", "repos"]:
+            repos = [self.repo_json(owner, name) for owner, names in self.server.repositories.items() for name in names]
+            self.send_page(repos, query, remaining)
+        elif len(parts) == 2 and parts[0] in ("users", "orgs") and parts[1] in self.server.repositories:
+            self.send_json(200, self.owner_json(parts[1]), remaining)
+        elif len(parts) == 3 and parts[0] in ("users", "orgs") and parts[2] == "repos" \
+                and parts[1] in self.server.repositories:
+            self.send_page([self.repo_json(parts[1], name) for name in self.server.repositories[parts[1]]], query,
+                           remaining)
+        elif len(parts) >= 3 and parts[0] == "repos" and parts[2] in self.server.repositories.get(parts[1], []):
+            self.serve_repo(parts[1], parts[2], parts[3:], query, remaining)
+        else:
+            self.send_json(404, {"message": "Not Found"}, remaining)
+
+    def serve_repo(self, owner, name, parts, query, remaining):
+        if not parts:
+            self.send_json(200, dict(self.repo_json(owner, name), has_issues=True, has_wiki=False), remaining)
+        elif parts == ["issues"]:
+            since = query.get("since", [""])[0]
+            issues = [self.issue_json(owner, name, number) for number in range(1, self.server.issues + 1)]
+            self.send_page([issue for issue in issues if issue["updated_at"] >= since], query, remaining)
+        elif parts in (["issues", "comments"], ["pulls"], ["pulls", "comments"], ["releases"]):
+            self.send_page([], query, remaining)
+        else:
+            self.send_json(404, {"message": "Not Found"}, remaining)
+
+    def owner_json(self, login):
+        owner_type = "Organization" if login in self.server.organizations else "User"
+        collection = "orgs" if owner_type == "Organization" else "users"
+        return {"login": login, "id": zlib.crc32(login.encode()), "type": owner_type,
+                "url": f"{self.server.url}/{collection}/{login}"}
+
+    def repo_json(self, owner, name):
+        return {"id": zlib.crc32((owner + "/" + name).encode()), "name": name, "full_name": owner + "/" + name,
+                "private": False, "owner": self.owner_json(owner), "url": f"{self.server.url}/repos/{owner}/{name}",
+                "clone_url": f"{self.server.url}/{owner}/{name}"}
+
+    def issue_json(self, owner, name, number):
+        updated_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1704067200 + number * 60))
+        return {"id": zlib.crc32(f"{owner}/{name}#{number}".encode()), "number": number, "title": f"Issue {number}",
+                "state": "open", "user": self.owner_json(owner), "created_at": updated_at, "updated_at": updated_at}
+
+    def send_page(self, items, query, remaining):
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["30"])[0])
+        start = (page - 1) * per_page
+        headers = {}
+        if start + per_page < len(items):
+            base = self.path.split("?")[0]
+            parameters = urlencode(dict({key: values[0] for key, values in query.items()}, page=page + 1,
+                                        per_page=per_page))
+            headers["Link"] = f'<{self.server.url}{base}?{parameters}>; rel="next"'
+        self.send_json(200, items[start:start + per_page], remaining, headers)
+
+    def send_json(self, status, content, remaining, headers=None):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-RateLimit-Limit", str(self.server.rate_limit or 5000))
+        self.send_header("X-RateLimit-Remaining", str(max(remaining, 0)))
+        self.send_header("X-RateLimit-Reset", str(self.server.rate_limit_reset))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def serve_git(self):
+        """Proxies the request to git http-backend as a CGI script, mapping /<owner>/<repo> to <owner>/<repo>.git."""
+        parsed = urlparse(self.path)
+        owner, repo, service_path = parsed.path.lstrip("/").split("/", 2)
+        body = self.read_body()
+        env = dict(os.environ,
+                   GIT_PROJECT_ROOT=self.server.repos_root,
+                   GIT_HTTP_EXPORT_ALL="1",
+                   PATH_INFO=f"/{owner}/{repo}.git/{service_path}",
+                   QUERY_STRING=parsed.query,
+                   REQUEST_METHOD=self.command,
+                   CONTENT_TYPE=self.headers.get("Content-Type", ""),
+                   CONTENT_LENGTH=str(len(body)),
+                   HTTP_CONTENT_ENCODING=self.headers.get("Content-Encoding", ""),
+                   HTTP_GIT_PROTOCOL=self.headers.get("Git-Protocol", ""),
+                   REMOTE_ADDR="127.0.0.1")
+        output = subprocess.run(["git", "http-backend"], input=body, env=env, stdout=subprocess.PIPE,
+                                check=False).stdout
+        header_block, _, content = output.partition(b"\r\n\r\n")
+        status = 200
+        headers = []
+        for line in header_block.decode().split("\r\n"):
+            key, _, value = line.partition(":")
+            if key.lower() == "status":
+                status = int(value.strip().split(" ")[0])
+            elif key:
+                headers.append((key, value.strip()))
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start_git_daemon(repos_root: str, port: int):
+    """Serves repos_root over the git:// protocol, as git://127.0.0.1:<port>/<owner>/<repo>.git."""
+    return subprocess.Popen(["git", "daemon", "--reuseaddr", "--export-all", "--listen=127.0.0.1",
+                             f"--port={port}", f"--base-path={repos_root}", repos_root],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
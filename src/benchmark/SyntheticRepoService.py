@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import subprocess
+
+
+def create_synthetic_repo(path: str, commits: int, files_per_commit: int, file_size: int, seed: int = 0):
+    """
+    Creates a bare repository with reproducible pseudo-random content by streaming it into git fast-import.
+
+    Args:
+        path (str): Path of the bare repository to create.
+        commits (int): Number of commits in the history of the default branch.
+        files_per_commit (int): Number of files added or modified by each commit.
+        file_size (int): Size in bytes of each file. Content is random, so it does not compress or delta.
+        seed (int): Seed of the content generator, the same seed produces the same repository.
+    """
+    subprocess.run(["git", "init", "--quiet", "--bare", "--initial-branch=main", path], check=True)
+    generator = random.Random(seed)
+    process = subprocess.Popen(["git", "fast-import", "--quiet"], cwd=path, stdin=subprocess.PIPE)
+    timestamp = 1700000000
+    for commit in range(commits):
+        message = f"Synthetic commit {commit}".encode()
+        process.stdin.write(b"commit refs/heads/main\n")
+        process.stdin.write(f"committer Benchmark <bench@example.com> {timestamp + commit} +0000\n".encode())
+        process.stdin.write(b"data %d\n%s\n" % (len(message), message))
+        for file in range(files_per_commit):
+            content = generator.getrandbits(file_size * 8).to_bytes(file_size, "little") if file_size else b""
+            process.stdin.write(f"M 644 inline file{file}.bin\n".encode())
+            process.stdin.write(b"data %d\n" % len(content))
+            process.stdin.write(content)
+            process.stdin.write(b"\n")
+    process.stdin.close()
+    if process.wait():
+        raise RuntimeError(f"git fast-import failed creating {path}")
+    subprocess.run(["git", "repack", "-a", "-d", "-q"], cwd=path, check=True)
+
+
+def copy_synthetic_repo(template_path: str, path: str):
+    """Creates a bare repository with the same content as template_path, hard linking its objects."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    subprocess.run(["git", "clone", "--quiet", "--bare", "--local", template_path, path], check=True)
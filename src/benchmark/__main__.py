@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from src.benchmark.BenchmarkService import main
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,41 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-from src.defines.FlattenLevel import FlattenLevel
-from src.defines.RenameStrategy import RenameStrategy
 from src.model.Repository import Repository
-from src.service.GitHubService import GitHubService, build_github_official_provider
 from src.service.ProviderService import ProviderService, build_provider, build_custom_provider
-from src.service.RepositoryService import compute_path
+from src.service.RepositoryService import find_git_repositories, find_git_repository_names, resolve_path_names, \
+    resolve_paths
 from src.service.TokenService import get_github_official_token, get_custom_provider_token, get_gitlab_official_token
 from src.defines.ProviderType import ProviderType
-from src.service.GitLabService import build_gitlab_official_provider, GitLabService
 from src.service.ArgumentParserService import build_argument_parser, parse_arguments
 from src.service.UnparserService import print_summary
+from src.service.LfsService import backup_lfs_objects
+from src.service.MaintenanceService import maintain_repositories
+from src.service.MetadataExportService import export_metadata
+from src.service.PlanService import diff_layout, format_diff, format_layout, get_plan_folders
+from src.service.ReportService import DISCOVERY_CACHE_NAME, STATE_NAME, build_report, read_discovery_cache, \
+    read_report, write_discovery_cache, write_report
+from src.service.StorageService import build_storage_service, count_failed_uploads, get_storage_key, \
+    submit_lfs_uploads, submit_metadata_uploads, submit_upload
+from src.service.VerifyService import verify_backup
+from src.service.TraceService import span, start_tracing, write_trace
+from src.service.MetricsService import observe_phase, record_repository, record_clone, start_metrics_server, \
+    write_metrics_textfile
 
 '''
 /backup/owner/provider/organization/repo
 '''
 
 
-def build_model(args):
+def build_providers(args):
+    # The provider services import their API clients, which take longer to import than the rest of the program, so
+    # they are only imported once a backup needs them and not for --help or --plan
+    from src.service.GitHubService import build_github_official_provider
+    from src.service.GitLabService import build_gitlab_official_provider
+
     providers = []
 
     if args.custom_providers:
@@ -41,15 +58,25 @@ def build_model(args):
             if not args.exclude_gitlab and not args.exclude_github:
                 providers.append(build_custom_provider(ProviderType.GITLAB, custom_provider))
                 providers.append(build_custom_provider(ProviderType.GITHUB, custom_provider))
+    return providers
+
+
+def build_provider_service(provider):
+    provider_service = None
+    if provider.provider is ProviderType.GITLAB:
+        from src.service.GitLabService import GitLabService
+        provider_service = GitLabService(provider.token, provider.url, provider.token_pool)
+    elif provider.provider is ProviderType.GITHUB:
+        from src.service.GitHubService import GitHubService
+        provider_service = GitHubService(provider.token, provider.url, provider.token_pool)
+    return provider_service
 
-    model = {}
+
+def discover_repositories(args, providers):
+    repositories = []
     for username in args.usernames:
         for provider in providers:
-            provider_service = None
-            if provider.provider is ProviderType.GITLAB:
-                provider_service = GitLabService(provider.token, provider.url)
-            elif provider.provider is ProviderType.GITHUB:
-                provider_service = GitHubService(provider.token, provider.url)
+            provider_service = build_provider_service(provider)
 
             organizations = [username]
             names = provider_service.get_user_organization_names(username)
@@ -57,64 +84,177 @@ def build_model(args):
             for organization in organizations:
                 repos = provider_service.get_organization_repo_names(organization)
                 for repo in repos:
-                    new_repo = Repository(args.backup_name, username, provider, organization, repo,
-                               provider.url + "/" + organization + "/" + repo)
-                    compute_path(new_repo, FlattenLevel.ROOT.name in args.flatten_directories,
-                                                 FlattenLevel.USER.name in args.flatten_directories,
-                                                 FlattenLevel.PROVIDER.name in args.flatten_directories,
-                                                 FlattenLevel.ORGANIZATION.name in args.flatten_directories)
-                    computed_path = new_repo.path
-                    if computed_path not in model:
-                        model[computed_path] = new_repo
-                    else:
-                        if args.rename_strategy == RenameStrategy.IGNORE:
-                            pass
-                        elif args.rename_strategy == RenameStrategy.SHORTEST:
-                            new_repo = Repository(args.backup_name, username, provider, organization, repo,
-                                       provider.url + "/" + organization + "/" + repo, computed_path)
-                            repo_name_level = FlattenLevel.USER
-                            while computed_path in model:
-                                repo_name_level = FlattenLevel(repo_name_level.value - 1)
-                                compute_path(new_repo, FlattenLevel.ROOT.name in args.flatten_directories,
-                                                              FlattenLevel.USER.name in args.flatten_directories,
-                                                              FlattenLevel.PROVIDER.name in args.flatten_directories,
-                                                              FlattenLevel.ORGANIZATION.name in args.flatten_directories,
-                                                              FlattenLevel(repo_name_level.value - 1))
-                            computed_path = new_repo.path
-                            model[computed_path] = new_repo
-                        elif args.rename_strategy == RenameStrategy.SYSTEMATIC:
-                            repo1 = model.pop(computed_path)
-                            compute_path(repo1, FlattenLevel.ROOT.name in args.flatten_directories,
-                                                              FlattenLevel.USER.name in args.flatten_directories,
-                                                              FlattenLevel.PROVIDER.name in args.flatten_directories,
-                                                              FlattenLevel.ORGANIZATION.name in args.flatten_directories,
-                                                              FlattenLevel.ROOT)
-                            model[repo1.path] = repo1
-
-                            new_repo = Repository(args.backup_name, username, provider, organization, repo,
-                                       provider.url + "/" + organization + "/" + repo)
-                            compute_path(new_repo, FlattenLevel.ROOT.name in args.flatten_directories,
-                                          FlattenLevel.USER.name in args.flatten_directories,
-                                          FlattenLevel.PROVIDER.name in args.flatten_directories,
-                                          FlattenLevel.ORGANIZATION.name in args.flatten_directories,
-                                          FlattenLevel.ROOT)
-                            model[new_repo.path] = new_repo
-                        elif args.rename_strategy == RenameStrategy.SHORTEST_SYSTEMATIC:
-                            pass
-                            # TODO
+                    record_repository(provider.url, "discovered")
+                    repositories.append(Repository(args.backup_name, username, provider, organization, repo,
+                                                   provider.url + "/" + organization + "/" + repo))
+    return repositories
+
 
+def resolve_model(args, repositories):
+    with span("resolve_paths", "path", repositories=len(repositories)):
+        model, skipped = resolve_paths(repositories, args.flatten_directories, args.rename_strategy)
+    for repository in skipped:
+        record_repository(repository.provider.url, "skipped")
     return model
 
 
-def clone_repos(model, backup_folder):
+def build_model(args, providers=None):
+    if providers is None:
+        providers = build_providers(args)
+    return resolve_model(args, discover_repositories(args, providers))
+
+
+def clone_repos(model, backup_folder, timeout=None, on_cloned=None):
+    failed = []
     for key, value in model.items():
-        provider_service = None
-        if value.provider.provider is ProviderType.GITLAB:
-            provider_service = GitLabService(value.provider.token, value.provider.url)
-        elif value.provider.provider is ProviderType.GITHUB:
-            provider_service = GitHubService(value.provider.token, value.provider.url)
+        provider_service = build_provider_service(value.provider)
         print(value.link + "   " + backup_folder + "/" + key.__str__())
-        provider_service.clone_repo(value.link, backup_folder / key)
+        try:
+            with span("transfer", "transfer", repository=value.link, path=key):
+                stats = provider_service.clone_repo(value.link, backup_folder / key, timeout)
+        except Exception as e:
+            # Such as a failed transfer or a destination that cannot be created, the other repos are still cloned
+            print(f"Error: could not clone {value.link}: {e}")
+            record_repository(value.provider.url, "failed")
+            failed.append(key)
+            continue
+        record_clone(value.provider.url, stats.duration, stats.received_bytes)
+        record_repository(value.provider.url, "cloned")
+        if on_cloned:
+            on_cloned(key)
+    return failed
+
+
+def print_token_usage(providers):
+    for provider in providers:
+        if len(provider.token_pool.tokens) > 1:
+            print(f"Token usage for {provider.url} ({provider.provider.name}):")
+            for line in provider.token_pool.report():
+                print("  - " + line)
+
+
+def backup(args):
+    """
+    Backs up the repos of args.usernames and returns the paths of the repos that could not be cloned and the number of
+    repos that could not be uploaded.
+    """
+    providers = build_providers(args)
+    with observe_phase("discovery"), span("discovery", "phase"):
+        repositories = discover_repositories(args, providers)
+    write_discovery_cache(os.path.join(args.backup_folder, DISCOVERY_CACHE_NAME), args.backup_name, repositories)
+    model = resolve_model(args, repositories)
+    print_token_usage(providers)
+    storage = None
+    if args.storage_url:
+        storage = build_storage_service(args.storage_url, args.storage_endpoint, args.storage_part_size * 1024 ** 2)
+
+    # Each repo is uploaded as soon as it is cloned, while the next ones are cloned and the later stages run
+    upload_futures = []
+    # Repos backed up for several users are stored under the same key, they are only uploaded once
+    uploaded_keys = set()
+    with ThreadPoolExecutor(max_workers=args.storage_jobs, thread_name_prefix="upload") as uploads:
+        def upload(key):
+            storage_key = get_storage_key(model[key])
+            if storage_key not in uploaded_keys:
+                uploaded_keys.add(storage_key)
+                upload_futures.append(submit_upload(storage, args.backup_folder / key, storage_key, uploads))
+
+        with observe_phase("clone"), span("clone", "phase"):
+            failed = clone_repos(model, args.backup_folder, args.transfer_timeout, upload if storage else None)
+        # The state is what restore reads, so it is written even if no report was asked for
+        report = build_report(args.backup_name, args.backup_folder, model, failed)
+        write_report(os.path.join(args.backup_folder, STATE_NAME), report)
+        if args.produce_json:
+            write_report(args.json_path, report)
+        if args.backup_lfs:
+            with observe_phase("lfs"), span("lfs", "phase"):
+                backup_lfs_objects([args.backup_folder / key for key in model], args.lfs_store, args.lfs_jobs,
+                                   args.transfer_timeout)
+            if storage:
+                upload_futures.extend(submit_lfs_uploads(storage, args.lfs_store, uploads))
+        if args.export_metadata:
+            with observe_phase("metadata"), span("metadata", "phase"):
+                services = {provider: build_provider_service(provider) for provider in providers}
+                export_metadata(model, args.backup_folder, services, args.metadata_jobs, args.transfer_timeout)
+            if storage:
+                # Only of the repos that were cloned, once per key as well
+                metadata_keys = set()
+                for key, repository in model.items():
+                    storage_key = get_storage_key(repository)
+                    if storage_key in uploaded_keys and storage_key not in metadata_keys:
+                        metadata_keys.add(storage_key)
+                        upload_futures.extend(submit_metadata_uploads(storage, args.backup_folder / key, storage_key,
+                                                                      uploads))
+    return failed, count_failed_uploads(upload_futures)
+
+
+def plan(args):
+    """
+    Lays out the repos found by the last discovery again with the current flatten and rename options, without calling
+    the providers, and prints the layout or how it differs from the repos in the backup folder.
+    """
+    cache_path = os.path.join(args.backup_folder, DISCOVERY_CACHE_NAME)
+    try:
+        repositories = read_discovery_cache(cache_path, args.backup_name)
+    except FileNotFoundError:
+        print(f"Error: there is no discovery of a previous backup in {args.backup_folder} to plan from")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    backup_name = repositories[0].backup if repositories else args.backup_name
+    if args.usernames:
+        repositories = [repository for repository in repositories if repository.owner in args.usernames]
+    model, skipped = resolve_path_names(repositories, args.flatten_directories, args.rename_strategy)
+    if args.plan == "layout":
+        print(format_layout(model, skipped), end="")
+        return
+
+    planned = {path: repository.link for path, repository in model.items()}
+    previous = {}
+    try:
+        report = read_report(os.path.join(args.backup_folder, STATE_NAME))
+        previous = {repository["link"]: repository["path"] for repository in report["repositories"]
+                    if repository["status"] == "cloned"}
+    except (FileNotFoundError, ValueError):
+        pass
+    on_disk = []
+    for folder in get_plan_folders(backup_name, args.usernames, args.flatten_directories):
+        if not os.path.isdir(os.path.join(args.backup_folder, folder)):
+            continue
+        for name in find_git_repository_names(os.path.join(args.backup_folder, folder)):
+            on_disk.append(name if not folder else folder if name == "." else f"{folder}/{name}")
+    print(format_diff(planned, *diff_layout(planned, on_disk, previous)), end="")
+
+
+def run(args):
+    if args.plan:
+        plan(args)
+        return
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    failed_clones = []
+    failed_uploads = 0
+    failed_verifications = 0
+    succeeded = False
+    # The textfile is written even if a stage raises, failed runs are the ones that alerts must see
+    try:
+        if args.usernames:
+            failed_clones, failed_uploads = backup(args)
+        if args.run_maintenance:
+            with observe_phase("maintenance"), span("maintenance", "phase"):
+                maintain_repositories(find_git_repositories(args.backup_folder), args.maintenance_jobs,
+                                      args.maintenance_cpus, args.maintenance_time_budget)
+        if args.run_verify:
+            with observe_phase("verify"), span("verify", "phase"):
+                failed_verifications = verify_backup(args.backup_folder, args.verify_jobs, args.verify_sample,
+                                                     args.transfer_timeout)
+        succeeded = not failed_clones and not failed_uploads and not failed_verifications
+    finally:
+        if args.metrics_textfile:
+            write_metrics_textfile(args.metrics_textfile, succeeded)
+    if not succeeded:
+        sys.exit(1)
 
 
 def main():
@@ -122,8 +262,24 @@ def main():
     args = parse_arguments(parser)
     if args.is_verbose:
         print_summary(args)
-    model = build_model(args)
-    clone_repos(model, args.backup_folder)
+    if args.trace_path:
+        start_tracing()
+    try:
+        if args.profile_path:
+            import cProfile
+            # Not cProfile.runctx, it swallows SystemExit and a failed run would exit 0
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                run(args)
+            finally:
+                profile.disable()
+                profile.dump_stats(args.profile_path)
+        else:
+            run(args)
+    finally:
+        if args.trace_path:
+            write_trace(args.trace_path)
 
 
 if __name__ == "__main__":
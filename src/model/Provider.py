@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from enum import Enum
+from typing import List, Optional
 
 from src.defines.ProviderType import ProviderType
+from src.model.TokenPool import TokenPool
 
 
 class Provider:
-    def __init__(self, provider: ProviderType, url: str, token: str):
+    def __init__(self, provider: ProviderType, url: str, token: str, tokens: Optional[List[str]] = None):
         self.provider = provider
         self.url = url
         self.token = token
+        # Shared by every service of this provider, so that the rate limit budget of each token is tracked globally
+        self.token_pool = TokenPool(tokens if tokens else [token])
 
 
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import threading
+import time
+from typing import List, Optional
+
+
+class TokenState:
+    def __init__(self, index: int, token: str):
+        self.index = index
+        self.token = token
+        # Unknown until the first response of the provider reports the rate limit of the token
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.reset: float = 0
+        self.calls = 0
+
+    def is_available(self, now: float):
+        return self.remaining is None or self.remaining > 0 or self.reset <= now
+
+    def budget(self, now: float):
+        if self.remaining is None or self.reset <= now:
+            return float("inf") if self.limit is None else self.limit
+        return self.remaining
+
+    def __str__(self):
+        return f"#{self.index} (...{self.token[-4:]})"
+
+
+class TokenPool:
+    """Tokens of a provider, handed out by remaining rate limit budget so that they are spent evenly."""
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = [TokenState(index, token) for index, token in enumerate(tokens, start=1)]
+        self.lock = threading.Lock()
+
+    def acquire(self) -> Optional[TokenState]:
+        """Returns the token with most remaining budget, or None if all of them are exhausted until their reset."""
+        with self.lock:
+            now = time.time()
+            available = [state for state in self.tokens if state.is_available(now)]
+            if not available:
+                return None
+            state = max(available, key=lambda s: s.budget(now))
+            state.calls += 1
+            return state
+
+    def update(self, state: TokenState, remaining: int, limit: int, reset: float):
+        with self.lock:
+            state.remaining = remaining
+            state.limit = limit
+            state.reset = reset
+
+    def next_reset(self) -> float:
+        with self.lock:
+            return min(state.reset for state in self.tokens)
+
+    def report(self) -> List[str]:
+        with self.lock:
+            return [f"Token {state}: {state.calls} calls, {state.remaining if state.remaining is not None else '?'}/"
+                    f"{state.limit if state.limit is not None else '?'} requests remaining"
+                    for state in self.tokens]
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+
+class TransferStats:
+    def __init__(self, url: str, path: Path, operation: str, objects: int = 0, received_bytes: int = 0,
+                 duration: float = 0.0):
+        self.url = url
+        self.path = path
+        self.operation = operation
+        self.objects = objects
+        self.received_bytes = received_bytes
+        self.duration = duration
+
+    def __str__(self):
+        return (f"TransferStats(url='{self.url}', path='{self.path}', operation='{self.operation}', "
+                f"objects={self.objects}, received_bytes={self.received_bytes}, duration={self.duration:.3f})")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+from pathlib import Path
+
+from src.service.ArgumentParserService import build_restore_argument_parser, parse_restore_arguments
+from src.service.LfsService import get_lfs_store
+from src.service.ReportService import read_report
+from src.service.RestoreService import deduplicate_repositories, find_target_collisions, format_template, \
+    push_mirror, restore_repositories, restore_working_tree, select_repositories
+
+'''
+Restores repos from a backup, selected by user, organization or glob, as working trees or as mirrors pushed elsewhere.
+
+python -m src.restore --organization my-org --checkout ~/src --lazy --sparse docs
+python -m src.restore --glob 'my-org/*' --push-mirror 'https://gitlab.example.com/{organization}/{name}.git'
+'''
+
+
+def main():
+    parser = build_restore_argument_parser()
+    args = parse_restore_arguments(parser)
+    try:
+        report = read_report(args.report_path)
+    except ValueError as e:
+        parser.error(str(e))
+
+    repositories = select_repositories(report["repositories"], args.backup_folder, args.users, args.organizations,
+                                       args.globs)
+    repositories = deduplicate_repositories(repositories)
+    if not repositories:
+        print("No repositories of the backup match the selection")
+        return
+
+    def find_lfs_store(source):
+        # Only the repos whose LFS objects were backed up have a store, so --lfs-store does not apply to the others
+        lfs_store = get_lfs_store(source)
+        return Path(args.lfs_store).absolute() if lfs_store and args.lfs_store else lfs_store
+
+    if args.checkout_folder:
+        def restore(repository, source):
+            destination = Path(args.checkout_folder) / format_template(args.layout, repository)
+            restore_working_tree(source, destination, repository["link"], args.is_lazy, args.sparse_directories,
+                                 args.transfer_timeout, find_lfs_store(source))
+            return str(destination)
+
+        targets = [Path(args.checkout_folder) / format_template(args.layout, repository) for repository in repositories]
+    else:
+        def restore(repository, source):
+            url = format_template(args.push_url, repository)
+            push_mirror(source, url, args.transfer_timeout, find_lfs_store(source))
+            return url
+
+        targets = [format_template(args.push_url, repository) for repository in repositories]
+
+    # Checked before anything is restored, repos restored into the same target at once would clobber each other
+    collisions = find_target_collisions(repositories, targets)
+    for target, links in collisions.items():
+        print(f"Error: {', '.join(links)} would all be restored into {target}")
+    if collisions:
+        print("Use a layout or URL template that tells them apart, such as one with {provider} or {path}")
+        sys.exit(1)
+
+    if args.is_dry_run:
+        for repository, target in zip(repositories, targets):
+            print(f"{repository['path']} -> {target}")
+        return
+
+    failed = restore_repositories(repositories, args.backup_folder, restore, args.jobs)
+    print(f"Restored {len(repositories) - failed} of {len(repositories)} repositories")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
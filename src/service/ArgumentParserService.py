@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import importlib.util
 import os
 import re
 from datetime import datetime
+from urllib.parse import urlparse
 
 from src.service.IOService import is_file_directory_writable, is_file_writable
 import argparse
@@ -11,7 +13,9 @@ from src.defines.CollisionAction import CollisionAction
 from src.defines.FlattenLevel import FlattenLevel
 from src.defines.ProviderType import ProviderType
 from src.defines.RenameStrategy import RenameStrategy
+from src.service.LfsService import is_lfs_available
 from src.service.ProviderService import build_provider
+from src.service.ReportService import STATE_NAME
 
 
 # TODO: prioritize argument to give priority
@@ -163,11 +167,156 @@ def build_argument_parser():
                         # nargs=0,
                         dest="exclude_enterprise",
                         action="store_true")
+    parser.add_argument("--transfer-timeout",
+                        help="Seconds after which the clone or fetch of a single repository is aborted.",
+                        type=float,
+                        dest="transfer_timeout",
+                        metavar="SECONDS")
+    parser.add_argument("--lfs",
+                        help="Back up the Git LFS objects of the repositories into a store shared by all of them and "
+                             "by all backups, downloading only the objects missing from it. Requires git-lfs.",
+                        dest="backup_lfs",
+                        action="store_true",
+                        default=False)
+    parser.add_argument("--lfs-store",
+                        help="Custom folder of the shared LFS object store. Implies --lfs. Defaults to .lfs in the "
+                             "backup folder.",
+                        type=str,
+                        dest="lfs_store",
+                        metavar="DIRECTORY_PATH")
+    parser.add_argument("--lfs-jobs",
+                        help="Number of repositories whose LFS objects are fetched at the same time.",
+                        type=int,
+                        dest="lfs_jobs",
+                        default=4,
+                        metavar="JOBS")
+    parser.add_argument("--metadata",
+                        help="Export the issues, pull requests, comments and releases of each repository as "
+                             "compressed NDJSON into a .metadata folder next to its clone, and back up its wiki into a "
+                             ".wiki folder. Only what changed since the previous export is fetched.",
+                        dest="export_metadata",
+                        action="store_true",
+                        default=False)
+    parser.add_argument("--metadata-jobs",
+                        help="Number of repositories whose metadata is exported at the same time.",
+                        type=int,
+                        dest="metadata_jobs",
+                        default=4,
+                        metavar="JOBS")
+    parser.add_argument("--storage",
+                        help="Upload a git bundle of each repository to this storage as soon as it is backed up, "
+                             "under HOST/ORGANIZATION/NAME, skipping the repositories whose content is already "
+                             "stored by any previous backup. With --lfs and --metadata, the LFS objects, the exported "
+                             "metadata and the wikis are uploaded as well. Either s3://BUCKET/PREFIX, "
+                             "which requires boto3 and takes the credentials from the AWS_ACCESS_KEY_ID and "
+                             "AWS_SECRET_ACCESS_KEY environment variables, or a folder.",
+                        type=str,
+                        dest="storage_url",
+                        metavar="URL")
+    parser.add_argument("--storage-endpoint",
+                        help="Endpoint of an S3-compatible server, such as http://localhost:9000 for MinIO.",
+                        type=str,
+                        dest="storage_endpoint",
+                        metavar="URL")
+    parser.add_argument("--storage-jobs",
+                        help="Number of repositories uploaded at the same time.",
+                        type=int,
+                        dest="storage_jobs",
+                        default=2,
+                        metavar="JOBS")
+    parser.add_argument("--storage-part-size",
+                        help="Size in MiB of the parts of multipart uploads, at least 5. Each upload sends 4 parts at "
+                             "the same time.",
+                        type=int,
+                        dest="storage_part_size",
+                        default=64,
+                        metavar="MIB")
+    parser.add_argument("--maintenance",
+                        help="After the backup, repack and write the commit-graph and multi-pack-index of the "
+                             "repositories in the backup folder that need it, or run a full gc on the most "
+                             "fragmented ones.",
+                        dest="run_maintenance",
+                        action="store_true",
+                        default=False)
+    parser.add_argument("--maintenance-jobs",
+                        help="Number of repositories maintained at the same time, at most --maintenance-cpus.",
+                        type=int,
+                        dest="maintenance_jobs",
+                        default=2,
+                        metavar="JOBS")
+    parser.add_argument("--maintenance-cpus",
+                        help="Number of CPUs shared by all the maintenance jobs. Defaults to all of them.",
+                        type=int,
+                        dest="maintenance_cpus",
+                        metavar="CPUS")
+    parser.add_argument("--maintenance-time-budget",
+                        help="Seconds after which maintenance stops, leaving the least fragmented repositories for "
+                             "the next run.",
+                        type=float,
+                        dest="maintenance_time_budget",
+                        metavar="SECONDS")
+    parser.add_argument("--verify",
+                        help="Verify the integrity of the repositories in the backup folder. Repositories are checked "
+                             "with git fsck the first time, then only the packs and refs that changed since they were "
+                             "last verified are checked, plus a rotating sample of the unchanged ones. Without "
+                             "usernames, only the verification is done.",
+                        dest="run_verify",
+                        action="store_true",
+                        default=False)
+    parser.add_argument("--verify-jobs",
+                        help="Number of checks run at the same time. Defaults to the number of CPUs.",
+                        type=int,
+                        dest="verify_jobs",
+                        metavar="JOBS")
+    parser.add_argument("--verify-sample",
+                        help="Fraction of the unchanged packs and refs verified again in each verification, the ones "
+                             "verified the longest ago first. 1 verifies everything.",
+                        type=float,
+                        dest="verify_sample",
+                        default=0.1,
+                        metavar="FRACTION")
+    parser.add_argument("--metrics-port",
+                        help="Serve Prometheus metrics of the backup run over HTTP in this port while it runs. The "
+                             "server stops with the run, so scheduled runs should use --metrics-textfile instead.",
+                        type=int,
+                        dest="metrics_port",
+                        metavar="PORT")
+    parser.add_argument("--metrics-textfile",
+                        help="Write Prometheus metrics of the backup run to this file at the end of the run, in the "
+                             "node_exporter textfile collector format.",
+                        type=str,
+                        dest="metrics_textfile",
+                        metavar="FILE_PATH")
+    parser.add_argument("--trace",
+                        help="Record timed spans of each phase and repository of the backup in this file, in Chrome "
+                             "trace-event JSON format (viewable in Perfetto or chrome://tracing).",
+                        type=str,
+                        dest="trace_path",
+                        metavar="FILE_PATH")
+    parser.add_argument("--profile",
+                        help="Profile the backup run with cProfile and dump the statistics to this file.",
+                        type=str,
+                        dest="profile_path",
+                        metavar="FILE_PATH")
+    parser.add_argument("--plan",
+                        help="Lay out again the repositories found by the discovery of the last backup in the backup "
+                             "folder, with the current -F and -R, without calling the providers or backing up "
+                             "anything, and print the path of each repository. Usernames, if given, restrict the plan "
+                             "to their repositories.",
+                        dest="plan",
+                        action="store_const",
+                        const="layout")
+    parser.add_argument("--plan-diff",
+                        help="Same as --plan, but print the repositories to clone (+), moved (~) and no longer planned "
+                             "(-) compared with the folder of that backup in the backup folder.",
+                        dest="plan",
+                        action="store_const",
+                        const="diff")
     # Positional argument for usernames of the profiles to scrap
     parser.add_argument("usernames",
                         help="List of usernames to back up.",
                         # type=List[str],
-                        nargs="+",
+                        nargs="*",
                         # dest="usernames",
                         metavar="USERNAME1 USERNAME2 USERNAME3 ...")
     return parser
@@ -176,15 +325,23 @@ def build_argument_parser():
 def parse_arguments(parser: argparse.ArgumentParser):
     args = parser.parse_args()
 
-    if not args.backup_name:
+    # A plan lays out the last backup again, so it uses its name unless another one is given
+    if not args.backup_name and not args.plan:
         args.backup_name = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")  # ISO 8601-like format
 
+    if args.plan and (args.produce_compressed or args.compressed_path or args.produce_json or args.json_path):
+        parser.error("--plan does not back up anything, so it cannot produce a compressed backup with -c or a JSON "
+                     "report with -j.")
+
     # Supply default backup directory
     if not args.backup_folder:
-        args.backup_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "backup")
+        args.backup_folder = get_default_backup_folder()
 
-    # Check existence and access of backup directory
-    if not os.path.exists(args.backup_folder):
+    # Check existence and access of backup directory, a plan only reads it
+    if args.plan:
+        if not os.path.isdir(args.backup_folder):
+            parser.error(f"The folder for the backup {args.backup_folder} does not exist, so there is nothing to plan.")
+    elif not os.path.exists(args.backup_folder):
         try:
             os.makedirs(args.backup_folder)
         except OSError as e:
@@ -223,6 +380,10 @@ def parse_arguments(parser: argparse.ArgumentParser):
     if not args.rename_strategy:
         args.rename_strategy = RenameStrategy.SHORTEST_SYSTEMATIC
 
+    # -R gives the name of the strategy
+    if isinstance(args.rename_strategy, str):
+        args.rename_strategy = RenameStrategy[args.rename_strategy]
+
     # If path supplied -c implicit
     if not args.produce_compressed and args.compressed_path:
         args.produce_compressed = True
@@ -256,6 +417,50 @@ def parse_arguments(parser: argparse.ArgumentParser):
     if args.json_path and not is_file_writable(args.json_path):
         parser.error("File " + args.json_path + " is not writable.")
 
+    # If LFS store supplied --lfs implicit
+    if not args.backup_lfs and args.lfs_store:
+        args.backup_lfs = True
+
+    # If --lfs but no store provided set to default value, shared by all the backups in the backup folder
+    if args.backup_lfs and not args.lfs_store:
+        args.lfs_store = os.path.join(args.backup_folder, ".lfs")
+
+    if args.backup_lfs and not is_lfs_available():
+        parser.error("Git LFS objects cannot be backed up with --lfs because git-lfs is not installed.")
+
+    if args.storage_url and urlparse(args.storage_url).scheme not in ("s3", "file", ""):
+        parser.error(f"Unsupported storage {args.storage_url} for --storage, use s3://BUCKET/PREFIX or a folder.")
+
+    if args.storage_url and urlparse(args.storage_url).scheme == "s3" and importlib.util.find_spec("boto3") is None:
+        parser.error("Repositories cannot be uploaded to S3 with --storage because boto3 is not installed.")
+
+    if args.storage_part_size < 5:
+        parser.error("The part size of multipart uploads with --storage-part-size must be at least 5 MiB.")
+
+    # Worker counts of the stages, each of them runs in a pool of that many workers
+    for option, value in (("--lfs-jobs", args.lfs_jobs), ("--metadata-jobs", args.metadata_jobs),
+                          ("--storage-jobs", args.storage_jobs), ("--maintenance-jobs", args.maintenance_jobs),
+                          ("--maintenance-cpus", args.maintenance_cpus), ("--verify-jobs", args.verify_jobs)):
+        if value is not None and value < 1:
+            parser.error(f"{option} must be at least 1.")
+
+    if not 0 <= args.verify_sample <= 1:
+        parser.error("The fraction of unchanged packs and refs to verify with --verify-sample must be between 0 and 1.")
+
+    # Usernames can only be omitted to verify an existing backup or plan from its last discovery
+    if not args.usernames and not args.run_verify and not args.plan:
+        parser.error("At least one username is required, unless only verifying the backup with --verify or planning "
+                     "its layout with --plan.")
+
+    # Check write access to metrics file
+    if args.metrics_textfile and not is_file_directory_writable(os.path.abspath(args.metrics_textfile)):
+        parser.error("File " + args.metrics_textfile + " is not writable because its directory cannot be accessed.")
+
+    # Check write access to trace and profile files
+    for file_path in (args.trace_path, args.profile_path):
+        if file_path and not is_file_directory_writable(os.path.abspath(file_path)):
+            parser.error("File " + file_path + " is not writable because its directory cannot be accessed.")
+
     # Check if at least one source is included
     if args.exclude_github and args.exclude_gitlab:
         parser.error("You cannot exclude both GitHub and GitLab. At least one provider must be included.")
@@ -270,10 +475,136 @@ def parse_arguments(parser: argparse.ArgumentParser):
     return args
 
 
+def get_default_backup_folder():
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "backup")
+
+
+def build_restore_argument_parser():
+    parser = argparse.ArgumentParser(description="Restore repos from a backup, as working trees or as mirrors pushed to "
+                                                 "another provider")
+    parser.add_argument("-b", "--backup-directory", "--backup-folder",
+                        help="Folder of the backup to restore from.",
+                        type=str,
+                        dest="backup_folder",
+                        metavar="DIRECTORY_PATH")
+    parser.add_argument("-J", "--json-path", "--report",
+                        help="Report of the backup to restore, written with -j. Defaults to the state of the last "
+                             "backup kept in the backup folder.",
+                        type=str,
+                        dest="report_path",
+                        metavar="FILE_PATH")
+    parser.add_argument("-u", "--user", "--users",
+                        help="Only restore the repos backed up for these users.",
+                        type=str,
+                        nargs="+",
+                        dest="users",
+                        metavar="USERNAME")
+    parser.add_argument("-o", "--organization", "--organizations",
+                        help="Only restore the repos of these users or organizations.",
+                        type=str,
+                        nargs="+",
+                        dest="organizations",
+                        metavar="ORGANIZATION")
+    parser.add_argument("-g", "--glob",
+                        help="Only restore the repos whose ORGANIZATION/NAME or path in the backup matches any of "
+                             "these shell patterns, such as 'my-org/api-*'.",
+                        type=str,
+                        nargs="+",
+                        dest="globs",
+                        metavar="PATTERN")
+    parser.add_argument("--checkout",
+                        help="Restore the repos as working trees in this folder, with a remote named backup that "
+                             "points to the backup and origin pointing to where the repo was backed up from.",
+                        type=str,
+                        dest="checkout_folder",
+                        metavar="DIRECTORY_PATH")
+    parser.add_argument("--layout",
+                        help="Path of each working tree inside the --checkout folder. Accepts the {user}, {provider}, "
+                             "{organization}, {name} and {path} placeholders.",
+                        type=str,
+                        dest="layout",
+                        default="{organization}/{name}",
+                        metavar="TEMPLATE")
+    parser.add_argument("--lazy",
+                        help="Create the working trees as partial clones of the backup, so file contents are only "
+                             "copied when they are checked out. The backup must stay reachable afterwards.",
+                        dest="is_lazy",
+                        action="store_true",
+                        default=False)
+    parser.add_argument("--sparse",
+                        help="Only check out these directories of the working trees, with a cone mode "
+                             "sparse-checkout. Files at the top level are always checked out.",
+                        type=str,
+                        nargs="+",
+                        dest="sparse_directories",
+                        metavar="DIRECTORY")
+    parser.add_argument("--push-mirror",
+                        help="Push all the branches and tags of each repo to this URL instead, such as "
+                             "'https://gitlab.example.com/{organization}/{name}.git'. Accepts the same placeholders "
+                             "as --layout. The repos must exist in the target, or it must create them on push.",
+                        type=str,
+                        dest="push_url",
+                        metavar="URL_TEMPLATE")
+    parser.add_argument("--lfs-store",
+                        help="Folder of the shared LFS object store of the backup, if it was moved since the backup. "
+                             "The LFS files of the repos backed up with --lfs are restored from it. Requires git-lfs.",
+                        type=str,
+                        dest="lfs_store",
+                        metavar="DIRECTORY_PATH")
+    parser.add_argument("--jobs",
+                        help="Number of repos restored at the same time.",
+                        type=int,
+                        dest="jobs",
+                        default=4,
+                        metavar="JOBS")
+    parser.add_argument("--transfer-timeout",
+                        help="Seconds after which the restore of a single repository is aborted.",
+                        type=float,
+                        dest="transfer_timeout",
+                        metavar="SECONDS")
+    parser.add_argument("-n", "--dry-run",
+                        help="Only print the repos that would be restored and where.",
+                        dest="is_dry_run",
+                        action="store_true",
+                        default=False)
+    return parser
+
+
+def parse_restore_arguments(parser: argparse.ArgumentParser):
+    args = parser.parse_args()
+
+    if not args.backup_folder:
+        args.backup_folder = get_default_backup_folder()
+
+    if not args.report_path:
+        args.report_path = os.path.join(args.backup_folder, STATE_NAME)
+
+    if not os.path.isfile(args.report_path):
+        parser.error(f"The report of the backup {args.report_path} does not exist. Run a backup first or supply the "
+                     f"report written with -j.")
+
+    if bool(args.checkout_folder) == bool(args.push_url):
+        parser.error("Supply either --checkout to restore working trees or --push-mirror to push mirrors.")
+
+    if args.push_url and (args.is_lazy or args.sparse_directories):
+        parser.error("--lazy and --sparse only apply to working trees restored with --checkout.")
+
+    if args.lfs_store and not os.path.isdir(args.lfs_store):
+        parser.error(f"The LFS store {args.lfs_store} does not exist.")
+
+    if args.checkout_folder and not args.is_dry_run:
+        try:
+            os.makedirs(args.checkout_folder, exist_ok=True)
+        except OSError as e:
+            parser.error(f"The folder {args.checkout_folder} to restore into cannot be created. Error: " + e.__str__())
+
+    return args
+
+
 def infer_name(input_string):
-    # Regular expressions
-    ip_regex = r'^((https?://)?((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?))$'
-    dns_regex = r'^((https?://)?([a-zA-Z0-9-]+\.)*[a-zA-Z0-9-]+)$'
+    # Regular expressions, both accept an optional port and trailing slash
+    ip_regex = r'^((https?://)?((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?))(:[0-9]+)?/?$'
+    dns_regex = r'^((https?://)?([a-zA-Z0-9-]+\.)*[a-zA-Z0-9-]+)(:[0-9]+)?/?$'
 
     # Check if the string is an IP or an IP with "https://"
     if re.match(ip_regex, input_string):
@@ -283,8 +614,8 @@ def infer_name(input_string):
 
     # Check if the string is a DNS name (including single-word hostnames)
     elif re.match(dns_regex, input_string):
-        # Extract the DNS name without "https://"
-        dns_match = re.search(r'([a-zA-Z0-9-]+\.)*[a-zA-Z0-9-]+$', input_string)
-        return dns_match.group()
+        # Extract the DNS name without "https://", port or trailing slash
+        dns_match = re.match(dns_regex, input_string)
+        return re.sub(r'^https?://', '', dns_match.group(1))
 
     raise ValueError("Invalid Input: " + input_string)
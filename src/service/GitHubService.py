@@ -1,33 +1,97 @@
-from typing import Optional, List
+import re
+import time
+from typing import Iterator, Optional, List
 
 from src.service.ArgumentParserService import infer_name
-from src.service.ProviderService import ProviderService, build_provider
+from src.model.TokenPool import TokenPool
+from src.service.MetricsService import observe_api_request, record_rate_limit_wait, record_token_usage
+from src.service.TraceService import span
+from src.service.ProviderService import ProviderService, build_pooled_provider
 from github import Github
 from github import Auth
-from git import Repo  # TODO separate in its own file
+from github import GithubException, RateLimitExceededException
+from urllib3.util import Retry
 
 
 from src.defines.ProviderType import ProviderType
-from src.service.TokenService import get_github_official_token
+from src.service.TokenService import get_github_official_tokens
+
+# Repo metadata that is exported: API path under the repo, query parameters and whether the list accepts since. Lists
+# with since are sorted by ascending update time, the others are newest first and paging stops at the first object
+# older than the cursor. Issues include pull requests, with their conversation; pulls add the branches and merge state
+METADATA_ENDPOINTS = {
+    "issues": ("/issues", {"state": "all", "sort": "updated", "direction": "asc"}, True),
+    "issue_comments": ("/issues/comments", {"sort": "updated", "direction": "asc"}, True),
+    "pulls": ("/pulls", {"state": "all", "sort": "updated", "direction": "desc"}, False),
+    "pull_comments": ("/pulls/comments", {"sort": "updated", "direction": "asc"}, True),
+    "releases": ("/releases", {}, False),
+}
+NEXT_LINK_REGEX = re.compile(r'<(?P<url>[^>]+)>;\s*rel="next"')
 
 
 class GitHubService(ProviderService):
     """Service for interacting with GitHub."""
 
-    def __init__(self, access_token, url: Optional[str] = None):
-        if url:
-            if infer_name(url).__eq__("github.com"):
-                self.g = Github(auth=Auth.Token(access_token))
+    def __init__(self, access_token, url: Optional[str] = None, token_pool: Optional[TokenPool] = None):
+        self.url = url if url else "https://github.com"
+        self.base_url = url if url and not infer_name(url).__eq__("github.com") else None
+        self.token_pool = token_pool if token_pool else TokenPool([access_token])
+        self.clients = {}
+        self.g = self._get_client(self.token_pool.tokens[0])
+
+    def _get_client(self, token):
+        client = self.clients.get(token.index)
+        if client is None:
+            # Rate limits are handled in _call by rotating tokens, so only transient server errors are retried here
+            retry = Retry(total=3, backoff_factor=1, status_forcelist=(500, 502, 503, 504))
+            if self.base_url:
+                client = Github(base_url=self.base_url, auth=Auth.Token(token.token), retry=retry)
             else:
-                self.g = Github(base_url=url, auth=Auth.Token(access_token))
-        else:
-            self.g = Github(auth=Auth.Token(access_token))
+                client = Github(auth=Auth.Token(token.token), retry=retry)
+            self.clients[token.index] = client
+        return client
+
+    def _close(self):
+        for client in self.clients.values():
+            client.close()
+
+    def _call(self, endpoint, request):
+        """
+        Runs request with the client of the token with most remaining budget. request receives the client and must
+        consume all the pages it needs. If the token gets rate limited the request is retried with another token, or
+        after the earliest reset if all of them are exhausted.
+        """
+        while True:
+            token = self.token_pool.acquire()
+            if token is None:
+                wait = max(self.token_pool.next_reset() - time.time(), 0) + 1
+                print(f"Rate limit exceeded for all tokens of {self.url}, waiting {int(wait)} seconds")
+                record_rate_limit_wait(self.url, wait)
+                with span("rate_limit_wait", "api", provider=self.url):
+                    time.sleep(wait)
+                continue
+
+            client = self._get_client(token)
+            try:
+                with observe_api_request(self.url, endpoint), span(endpoint, "api", provider=self.url, token=token):
+                    result = request(client)
+            except RateLimitExceededException as e:
+                # Secondary rate limits tell how long to wait, primary ones reset at the time of the reset header
+                retry_after = (e.headers or {}).get("retry-after")
+                reset = time.time() + int(retry_after) if retry_after else client.requester.rate_limiting_resettime
+                self.token_pool.update(token, 0, client.requester.rate_limiting[1], max(reset, time.time() + 1))
+                record_token_usage(self.url, token)
+                continue
+
+            remaining, limit = client.requester.rate_limiting
+            if limit >= 0:
+                self.token_pool.update(token, remaining, limit, client.requester.rate_limiting_resettime)
+            record_token_usage(self.url, token)
+            return result
 
     def get_user_organizations(self):
-        user_orgs = []
-        for orgs in self.g.get_user().get_orgs():
-            user_orgs.append(orgs)
-        self.g.close()
+        user_orgs = self._call("user/orgs", lambda g: list(g.get_user().get_orgs()))
+        self._close()
         return user_orgs
 
     def get_user_organization_names(self, username) -> List[str]:
@@ -38,20 +102,20 @@ class GitHubService(ProviderService):
         return user.get_repos()
 
     def get_user_owned_repos(self, username):
-        user_repos = self.g.get_user(username).get_repos()
+        user_repos = self._call("users/repos", lambda g: list(g.get_user(username).get_repos()))
         owned_repos = [repo for repo in user_repos if repo.owner.login == username]
-        self.g.close()
+        self._close()
         return owned_repos
 
     def get_user_owned_repo_names(self, username) -> List[str]:
         return [repo.name for repo in self.get_user_owned_repos(username)]
 
     def get_user_collaboration_repos(self, username):
-        user_repos = self.get_user_repos()
+        user_repos = self._call("user/repos", lambda g: list(g.get_user().get_repos()))
         org_names = self.get_user_organization_names(username)
         owned_repos = [repo for repo in user_repos
                        if repo.owner.login != username and repo.owner.login not in org_names]
-        self.g.close()
+        self._close()
         return owned_repos
 
     def get_user_collaboration_repo_names(self, username) -> List[str]:
@@ -63,9 +127,43 @@ class GitHubService(ProviderService):
     def get_organization_repo_names(self, organization) -> List[str]:
         return [repo.name for repo in self.get_user_owned_repos(organization)]
 
-    def clone_repo(self, url, path):
-        Repo.clone_from(url, path)
+    def get_metadata_kinds(self) -> List[str]:
+        return list(METADATA_ENDPOINTS)
+
+    def get_metadata_pages(self, organization, name, kind, since=None) -> Iterator[List[dict]]:
+        # Raw JSON pages are requested instead of PyGithub objects, which would make a request per object to
+        # complete them. Each page is a separate call, so that a rate limit only retries that page
+        path, parameters, accepts_since = METADATA_ENDPOINTS[kind]
+        url = f"/repos/{organization}/{name}{path}"
+        parameters = dict(parameters, per_page=100)
+        if since and accepts_since:
+            parameters["since"] = since
+        while url:
+            try:
+                headers, page = self._call("repos/" + kind,
+                                           lambda g: g.requester.requestJsonAndCheck("GET", url, parameters))
+            except GithubException as e:
+                # Issues disabled in the repo, or the repo is gone since it was discovered
+                if e.status in (404, 410):
+                    return
+                raise
+            if since and not accepts_since:
+                recent = [item for item in page if (item.get("updated_at") or item["created_at"]) >= since]
+                if len(recent) < len(page):
+                    yield recent
+                    return
+            yield page
+            match = NEXT_LINK_REGEX.search(headers.get("link", ""))
+            url = match.group("url") if match else None
+            parameters = None
+
+    def get_wiki_url(self, organization, name) -> Optional[str]:
+        headers, repo = self._call("repos", lambda g: g.requester.requestJsonAndCheck(
+            "GET", f"/repos/{organization}/{name}"))
+        if not repo.get("has_wiki"):
+            return None
+        return re.sub(r'(\.git)?$', ".wiki.git", repo["clone_url"], count=1)
 
 
 def build_github_official_provider():
-    return build_provider(ProviderType.GITHUB, 'https://github.com', get_github_official_token())
+    return build_pooled_provider(ProviderType.GITHUB, 'https://github.com', get_github_official_tokens())
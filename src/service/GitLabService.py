@@ -1,15 +1,17 @@
 from typing import List, Optional
 
-from src.service.ProviderService import ProviderService, build_provider
+from src.service.ProviderService import ProviderService, build_pooled_provider
 from src.defines.ProviderType import ProviderType
-from src.service.TokenService import get_gitlab_official_token
+from src.model.TokenPool import TokenPool
+from src.service.TokenService import get_gitlab_official_tokens
 
 
 class GitLabService(ProviderService):
     """Service for interacting with GitLab."""
 
-    def __init__(self, access_token, url: Optional[str] = None):
+    def __init__(self, access_token, url: Optional[str] = None, token_pool: Optional[TokenPool] = None):
         self.access_token = access_token
+        self.token_pool = token_pool
         if url:
             pass
             #self.g = Github(base_url=url, auth=Auth.Token(access_token))
@@ -31,4 +33,4 @@ class GitLabService(ProviderService):
 
 
 def build_gitlab_official_provider():
-    return build_provider(ProviderType.GITLAB, 'https://gitlab.com/', get_gitlab_official_token())
+    return build_pooled_provider(ProviderType.GITLAB, 'https://gitlab.com/', get_gitlab_official_tokens())
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from src.model.TransferStats import TransferStats
+
+# Settings used for every transfer:
+# - protocol v2, so that the server only advertises the refs that are asked for
+# - received packs are kept as packs instead of being exploded into loose objects
+# - no automatic gc or commit-graph writes in the middle of a backup, maintenance is a separate stage
+# - transfers that stall below 1 KiB/s for a minute are aborted instead of hanging forever
+# - index and checkout use all the cores
+# - partial clones can be made from local repos, such as a restore from the backup
+TRANSFER_CONFIG = {
+    "protocol.version": "2",
+    "fetch.unpackLimit": "1",
+    "transfer.unpackLimit": "1",
+    "gc.auto": "0",
+    "fetch.writeCommitGraph": "false",
+    "http.lowSpeedLimit": "1024",
+    "http.lowSpeedTime": "60",
+    "index.threads": "true",
+    "checkout.workers": "0",
+    "uploadpack.allowFilter": "true",
+}
+
+# LFS objects are not downloaded while checking out a clone, they are backed up by their own stage into a shared store
+TRANSFER_ENVIRONMENT = {
+    "GIT_LFS_SKIP_SMUDGE": "1",
+    "GIT_TERMINAL_PROMPT": "0",
+}
+
+# Matches progress lines such as "Receiving objects:  45% (450/1000), 1.20 MiB | 2.30 MiB/s"
+PROGRESS_REGEX = re.compile(r'^(?P<stage>[A-Za-z ]+):\s+(?P<percent>\d+)% \((?P<current>\d+)/(?P<total>\d+)\)'
+                            r'(, (?P<size>[\d.]+) (?P<unit>bytes|KiB|MiB|GiB))?')
+UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+
+class GitTransportError(Exception):
+    def __init__(self, message: str, returncode: Optional[int] = None, stderr: str = ""):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+def build_git_command(arguments: List[str], config: Optional[dict] = None) -> List[str]:
+    command = ["git"]
+    for key, value in (config if config is not None else TRANSFER_CONFIG).items():
+        command.extend(["-c", f"{key}={value}"])
+    return command + arguments
+
+
+def run_git(arguments: List[str], cwd=None, timeout: Optional[float] = None, check: bool = True,
+            config: Optional[dict] = None, input: Optional[str] = None) -> subprocess.CompletedProcess:
+    """Runs a short git command and returns its completed process, with stdout and stderr decoded."""
+    command = build_git_command(arguments, config if config is not None else {})
+    process = subprocess.Popen(command, cwd=cwd, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True)
+    try:
+        stdout, stderr = process.communicate(input, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _stop(process)
+        raise GitTransportError(f"git {' '.join(arguments)} timed out after {timeout} seconds")
+    except BaseException:
+        _stop(process)
+        raise
+    completed = subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+    if check and completed.returncode:
+        raise GitTransportError(f"git {' '.join(arguments)} failed with exit code {completed.returncode}: "
+                                f"{completed.stderr.strip()}", completed.returncode, completed.stderr)
+    return completed
+
+
+class GitOutputStream:
+    """
+    Readable binary stream of the standard output of a git command, such as git bundle create -.
+
+    Reading the end of the stream waits for git and raises GitTransportError if it failed, so a consumer never
+    mistakes the output of a failed command for a complete one. Closing the stream stops git if it is still running.
+    """
+    def __init__(self, arguments: List[str], cwd=None):
+        self.arguments = arguments
+        # stderr goes to a file, so git never blocks on it while only stdout is read
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(build_git_command(arguments, {}), cwd=cwd, stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.PIPE, stderr=self.stderr, start_new_session=True)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.process.stdout.read(size)
+        if not data and size != 0:
+            returncode = self.process.wait()
+            if returncode:
+                self.stderr.seek(0)
+                stderr = self.stderr.read().decode(errors="replace").strip()
+                raise GitTransportError(f"git {' '.join(self.arguments)} failed with exit code {returncode}: "
+                                        f"{stderr}", returncode, stderr)
+        return data
+
+    def close(self):
+        if self.process.poll() is None:
+            _stop(self.process)
+        self.process.stdout.close()
+        self.stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_pack_size(git_directory: Path) -> int:
+    pack_directory = git_directory / "objects" / "pack"
+    if not pack_directory.is_dir():
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(pack_directory) if entry.name.endswith(".pack"))
+
+
+def is_git_repository(path: Path) -> bool:
+    return (path / ".git").exists() or ((path / "objects").is_dir() and (path / "HEAD").is_file())
+
+
+def get_git_directory(path: Path) -> Path:
+    return path / ".git" if (path / ".git").is_dir() else path
+
+
+def _stop(process: subprocess.Popen):
+    # git runs helpers such as git-remote-https and index-pack, so the whole session is signalled
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def run_transfer(arguments: List[str], stats: TransferStats, cwd=None, timeout: Optional[float] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 progress: Optional[Callable[[str, int, int, int], None]] = None) -> TransferStats:
+    """
+    Runs a git command that transfers objects, parsing its progress output as it is produced.
+
+    Args:
+        arguments (list): Arguments of git, which must include --progress.
+        stats (TransferStats): Statistics to fill with the number of objects, received bytes and duration.
+        cwd (str): Working directory of git.
+        timeout (float): Seconds after which git is stopped and the transfer fails.
+        cancel_event (threading.Event): If set during the transfer, git is stopped and the transfer fails.
+        progress (callable): Called with stage, percent, current and total on each progress update.
+
+    Returns:
+        TransferStats: stats, filled.
+
+    Raises:
+        GitTransportError: If git fails, times out or is cancelled.
+    """
+    start = time.monotonic()
+    deadline = start + timeout if timeout else None
+    process = subprocess.Popen(build_git_command(arguments), cwd=cwd, env=dict(os.environ, **TRANSFER_ENVIRONMENT),
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               start_new_session=True)
+    # Last lines of output that are not progress updates, to explain failures
+    output = deque(maxlen=20)
+    buffer = b""
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                _stop(process)
+                raise GitTransportError(f"git {arguments[0]} of {stats.url} was cancelled")
+            if deadline is not None and time.monotonic() > deadline:
+                _stop(process)
+                raise GitTransportError(f"git {arguments[0]} of {stats.url} timed out after {timeout} seconds")
+
+            ready, _, _ = select.select([process.stderr], [], [], 0.5)
+            if not ready:
+                continue
+            chunk = os.read(process.stderr.fileno(), 65536)
+            if not chunk:
+                break
+            # Progress lines are terminated by \r while they are being updated and by \n when they are done
+            lines = re.split(rb'[\r\n]', buffer + chunk)
+            buffer = lines.pop()
+            for line in lines:
+                _parse_progress_line(line.decode(errors="replace").strip(), stats, output, progress)
+        _parse_progress_line(buffer.decode(errors="replace").strip(), stats, output, progress)
+        returncode = process.wait()
+    except BaseException:
+        if process.poll() is None:
+            _stop(process)
+        raise
+    finally:
+        process.stderr.close()
+
+    stats.duration = time.monotonic() - start
+    if returncode:
+        stderr = "\n".join(output)
+        raise GitTransportError(f"git {arguments[0]} of {stats.url} failed with exit code {returncode}: {stderr}",
+                                returncode, stderr)
+    return stats
+
+
+def _parse_progress_line(line: str, stats: TransferStats, output: deque, progress):
+    if not line:
+        return
+    match = PROGRESS_REGEX.match(line)
+    if not match:
+        output.append(line)
+        return
+    stage = match.group("stage")
+    if stage == "Receiving objects":
+        stats.objects = int(match.group("total"))
+        if match.group("size"):
+            stats.received_bytes = int(float(match.group("size")) * UNITS[match.group("unit")])
+    if progress is not None:
+        progress(stage, int(match.group("percent")), int(match.group("current")), int(match.group("total")))
+    if line.endswith("done."):
+        output.append(line)
+
+
+def clone(url: str, path: Path, mirror: bool = False, timeout: Optional[float] = None,
+          cancel_event: Optional[threading.Event] = None, progress=None,
+          options: Optional[List[str]] = None) -> TransferStats:
+    path = Path(path)
+    stats = TransferStats(url, path, "clone")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    arguments = ["clone", "--progress"]
+    if mirror:
+        arguments.append("--mirror")
+    if options:
+        arguments.extend(options)
+    existed = path.exists()
+    try:
+        run_transfer(arguments + ["--", url, str(path)], stats, timeout=timeout, cancel_event=cancel_event,
+                     progress=progress)
+    except BaseException:
+        # Do not leave a partial clone behind, it would be fetched instead of cloned by the next backup
+        if not existed:
+            shutil.rmtree(path, ignore_errors=True)
+        raise
+    if not stats.received_bytes:
+        # Small transfers do not report their size, the received pack is kept as is so its size is used instead
+        stats.received_bytes = get_pack_size(get_git_directory(path))
+    return stats
+
+
+def fetch(path: Path, url: Optional[str] = None, timeout: Optional[float] = None,
+          cancel_event: Optional[threading.Event] = None, progress=None) -> TransferStats:
+    path = Path(path)
+    stats = TransferStats(url, path, "fetch")
+    pack_size = get_pack_size(get_git_directory(path))
+    if url:
+        # The repo may have been transferred or its provider moved since it was cloned, origin follows its link
+        run_git(["remote", "set-url", "origin", url], cwd=str(path), timeout=timeout)
+    run_transfer(["fetch", "--progress", "--prune", "--tags", "origin"], stats, cwd=str(path), timeout=timeout,
+                 cancel_event=cancel_event, progress=progress)
+    if not stats.received_bytes:
+        stats.received_bytes = max(get_pack_size(get_git_directory(path)) - pack_size, 0)
+    return stats
+
+
+def transfer(url: str, path: Path, timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None,
+             progress=None) -> TransferStats:
+    """Clones url into path, or fetches it if path already holds a clone from a previous backup."""
+    path = Path(path)
+    if is_git_repository(path):
+        return fetch(path, url, timeout, cancel_event, progress)
+    return clone(url, path, timeout=timeout, cancel_event=cancel_event, progress=progress)
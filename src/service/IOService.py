@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import json
 import os
 
 
@@ -102,3 +103,38 @@ def read_env_var(var_name):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         raise
+
+
+def get_directory_size(directory_path):
+    """
+    Computes the size in bytes of all the regular files under a directory, without following symlinks.
+
+    Args:
+        directory_path (str): Path to the directory.
+
+    Returns:
+        int: The accumulated size of the files, 0 if the directory does not exist.
+    """
+    size = 0
+    for root, _, files in os.walk(directory_path):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                continue
+    return size
+
+
+def write_json_atomically(file_path, content):
+    """
+    Writes content as JSON to a temporary file next to file_path and then replaces file_path with it, so an
+    interrupted write keeps the previous content.
+
+    Args:
+        file_path (str): Path to the JSON file.
+        content: Object serializable to JSON.
+    """
+    temporary_path = str(file_path) + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(content, file, indent=1, sort_keys=True)
+    os.replace(temporary_path, file_path)
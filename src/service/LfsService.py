@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from src.model.TransferStats import TransferStats
+from src.service.GitTransportService import GitTransportError, run_git, run_transfer
+from src.service.MetricsService import record_lfs_objects
+from src.service.TraceService import span
+
+# Lines of git lfs ls-files --long, such as "4d7a2146...e2b - assets/logo.png"
+LS_FILES_REGEX = re.compile(r'^(?P<oid>[0-9a-f]{64}) [*-] ')
+
+
+def is_lfs_available() -> bool:
+    try:
+        return run_git(["lfs", "version"], check=False).returncode == 0
+    except OSError:
+        return False
+
+
+def get_object_path(store: Path, oid: str) -> Path:
+    """Path of an object in the store, which uses the same layout as the objects folder of git-lfs."""
+    return store / "objects" / oid[0:2] / oid[2:4] / oid
+
+
+def get_lfs_store(path: Path) -> Optional[Path]:
+    """Store the LFS objects of the backup in path were backed up into, or None if they were never backed up."""
+    value = run_git(["config", "--get", "lfs.storage"], cwd=str(path), check=False).stdout.strip()
+    return Path(value) if value else None
+
+
+def uses_lfs(path: Path) -> bool:
+    """Cheap check of whether the .gitattributes at the tip of any ref track files with LFS, before asking git-lfs."""
+    tips = set(run_git(["for-each-ref", "--format=%(objectname)", "refs/heads", "refs/remotes", "refs/tags"],
+                       cwd=str(path)).stdout.split())
+    if not tips:
+        return False
+    if len(tips) > 1000:
+        # Too many refs to pass them as arguments, let git-lfs do the walk
+        return True
+    completed = run_git(["grep", "--quiet", "--fixed-strings", "filter=lfs"] + sorted(tips)
+                        + ["--", ":(glob)**/.gitattributes"], cwd=str(path), check=False)
+    return completed.returncode == 0
+
+
+def get_lfs_oids(path: Path) -> Set[str]:
+    """Object ids of all the LFS files referenced by any ref of the repository in path."""
+    completed = run_git(["lfs", "ls-files", "--all", "--long"], cwd=str(path))
+    return {match.group("oid") for match in map(LS_FILES_REGEX.match, completed.stdout.splitlines()) if match}
+
+
+def count_downloaded(stats: TransferStats, store: Path, missing: Set[str]):
+    """Sets the objects and received bytes of stats from the objects of missing that are now in store."""
+    downloaded = [get_object_path(store, oid) for oid in missing if get_object_path(store, oid).exists()]
+    stats.objects = len(downloaded)
+    stats.received_bytes = sum(object_path.stat().st_size for object_path in downloaded)
+
+
+def fetch_lfs_objects(path: Path, store: Path, oids: Set[str], timeout: Optional[float] = None) -> TransferStats:
+    """
+    Downloads the LFS objects of the repository in path that are missing from store into store.
+
+    The repository must be configured to use store as its LFS storage, so git-lfs skips the objects that are already
+    there, including the ones downloaded for other repositories or for previous backups.
+    """
+    stats = TransferStats(str(path), path, "lfs")
+    missing = {oid for oid in oids if not get_object_path(store, oid).exists()}
+    if not missing:
+        return stats
+
+    run_transfer(["lfs", "fetch", "--all"], stats, cwd=str(path), timeout=timeout)
+    count_downloaded(stats, store, missing)
+    return stats
+
+
+def plan_lfs_fetches(oids_per_repo: Dict[Path, Set[str]], store: Path) -> List[List[Path]]:
+    """
+    Splits the repositories in two waves so that an object shared by several repositories is downloaded once.
+
+    Each missing object is claimed by the first repository, by number of missing objects, that references it. The
+    first wave fetches the repositories that claimed any object, concurrently. The second wave holds the repositories
+    whose missing objects were all claimed by others, so after the first wave they usually have nothing to fetch.
+    """
+    claimed = set()
+    first_wave = []
+    second_wave = []
+    missing_per_repo = {path: {oid for oid in oids if not get_object_path(store, oid).exists()}
+                        for path, oids in oids_per_repo.items()}
+    for path, missing in sorted(missing_per_repo.items(), key=lambda item: len(item[1]), reverse=True):
+        if not missing:
+            continue
+        if missing - claimed:
+            first_wave.append(path)
+            claimed.update(missing)
+        else:
+            second_wave.append(path)
+    return [first_wave, second_wave]
+
+
+def backup_lfs_objects(paths: List[Path], store: Path, jobs: int = 4, timeout: Optional[float] = None):
+    """Backs up the LFS objects of the repositories in paths into the content-addressed store, jobs at a time."""
+    store = Path(store).absolute()
+    store.mkdir(parents=True, exist_ok=True)
+
+    def list_oids(path):
+        try:
+            with span("lfs_ls_files", "lfs", path=path):
+                if not uses_lfs(path):
+                    return path, set()
+                # Also needed by git lfs checkout when restoring, so it is set even if nothing is missing
+                run_git(["config", "lfs.storage", str(store)], cwd=str(path))
+                return path, get_lfs_oids(path)
+        except GitTransportError as e:
+            print(f"Error: could not list LFS objects of {path}: {e}")
+            return path, set()
+
+    def fetch(path):
+        missing = {oid for oid in oids_per_repo[path] if not get_object_path(store, oid).exists()}
+        try:
+            with span("lfs_fetch", "lfs", path=path):
+                fetched[path] = fetch_lfs_objects(path, store, oids_per_repo[path], timeout)
+        except GitTransportError as e:
+            print(f"Error: could not fetch LFS objects of {path}: {e}")
+            errors.add(path)
+            # git-lfs may have downloaded some objects before failing, they are fetched rather than present
+            fetched[path] = TransferStats(str(path), path, "lfs")
+            count_downloaded(fetched[path], store, missing)
+
+    fetched = {}
+    errors = set()
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="lfs") as executor:
+        oids_per_repo = dict(executor.map(list_oids, [path for path in paths if path.is_dir()]))
+        for wave in plan_lfs_fetches(oids_per_repo, store):
+            list(executor.map(fetch, wave))
+
+    for path, oids in oids_per_repo.items():
+        stats = fetched.get(path, TransferStats(str(path), path, "lfs"))
+        # Whatever is still missing from the store failed, whether git-lfs failed or skipped it without an error
+        failed = sum(1 for oid in oids if not get_object_path(store, oid).exists())
+        if failed and path in fetched and path not in errors:
+            print(f"Error: {failed} LFS objects of {path} could not be fetched")
+        record_lfs_objects(len(oids) - stats.objects - failed, stats.objects, stats.received_bytes, failed)
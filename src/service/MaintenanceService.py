@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import List, Optional
+
+from src.service.GitTransportService import GitTransportError, get_git_directory, run_git
+from src.service.MetricsService import record_maintenance
+from src.service.TraceService import record_span
+
+# Loose objects above which they are packed, and packs above which they are consolidated with the multi-pack-index
+LOOSE_OBJECTS_LIMIT = 100
+PACKS_LIMIT = 10
+# Above these the repository is too fragmented for incremental tasks and a full gc is done instead
+GC_LOOSE_OBJECTS_LIMIT = 6700
+GC_PACKS_LIMIT = 50
+
+LOOSE_OBJECT_FOLDER_REGEX = re.compile(r'^[0-9a-f]{2}$')
+# Touched in the git directory after each successful maintenance
+MAINTENANCE_MARKER = "backup-maintenance"
+
+
+class RepositoryState:
+    def __init__(self, path: Path, packs: int, loose_objects: int, is_commit_graph_outdated: bool,
+                 has_multi_pack_index: bool):
+        self.path = path
+        self.packs = packs
+        self.loose_objects = loose_objects
+        self.is_commit_graph_outdated = is_commit_graph_outdated
+        self.has_multi_pack_index = has_multi_pack_index
+
+    def __str__(self):
+        return (f"RepositoryState(path='{self.path}', packs={self.packs}, loose_objects={self.loose_objects}, "
+                f"is_commit_graph_outdated={self.is_commit_graph_outdated}, "
+                f"has_multi_pack_index={self.has_multi_pack_index})")
+
+
+def get_repository_state(path: Path) -> RepositoryState:
+    git_directory = get_git_directory(path)
+    objects = git_directory / "objects"
+    pack_times = []
+    pack_folder = objects / "pack"
+    if pack_folder.is_dir():
+        pack_times = [entry.stat().st_mtime for entry in os.scandir(pack_folder) if entry.name.endswith(".pack")]
+    loose_objects = 0
+    if objects.is_dir():
+        for entry in os.scandir(objects):
+            if entry.is_dir() and LOOSE_OBJECT_FOLDER_REGEX.match(entry.name):
+                loose_objects += sum(1 for _ in os.scandir(entry.path))
+    # Fetches do not write the commit-graph, so it is outdated if any pack is newer than it. git does not rewrite it
+    # when there are no new commits, so the packs written by the last maintenance itself are not counted
+    commit_graph_time = 0
+    for commit_graph in (objects / "info" / "commit-graph", objects / "info" / "commit-graphs" / "commit-graph-chain",
+                         git_directory / MAINTENANCE_MARKER):
+        if commit_graph.exists():
+            commit_graph_time = max(commit_graph_time, commit_graph.stat().st_mtime)
+    is_commit_graph_outdated = bool(pack_times) and max(pack_times) > commit_graph_time
+    has_multi_pack_index = (pack_folder / "multi-pack-index").exists()
+    return RepositoryState(path, len(pack_times), loose_objects, is_commit_graph_outdated, has_multi_pack_index)
+
+
+def plan_maintenance(state: RepositoryState, loose_objects_limit: int = LOOSE_OBJECTS_LIMIT,
+                     packs_limit: int = PACKS_LIMIT) -> List[str]:
+    """Returns the git maintenance tasks that the repository needs, "gc" alone if it needs a full gc."""
+    if state.packs > GC_PACKS_LIMIT or state.loose_objects > GC_LOOSE_OBJECTS_LIMIT:
+        return ["gc"]
+    tasks = []
+    if state.loose_objects > loose_objects_limit:
+        tasks.append("loose-objects")
+    if state.packs > packs_limit or (state.packs > 1 and not state.has_multi_pack_index):
+        tasks.append("incremental-repack")
+    if tasks or state.is_commit_graph_outdated:
+        tasks.append("commit-graph")
+    return tasks
+
+
+def get_priority(state: RepositoryState) -> float:
+    # Most fragmented repositories first, so that they are the ones maintained if the time budget runs out
+    return state.packs / PACKS_LIMIT + state.loose_objects / LOOSE_OBJECTS_LIMIT
+
+
+def maintain_repository(path: Path, tasks: List[str], threads: int, timeout: Optional[float]):
+    """Runs in a worker process. Returns the path, the tasks, start and end times, the worker pid and any error."""
+    start = time.perf_counter_ns()
+    error = None
+    config = {"pack.threads": str(threads), "gc.autoDetach": "false", "maintenance.auto": "false"}
+    try:
+        if tasks == ["gc"]:
+            run_git(["gc", "--quiet"], cwd=str(path), timeout=timeout, config=config)
+        else:
+            run_git(["maintenance", "run", "--quiet"] + [f"--task={task}" for task in tasks], cwd=str(path),
+                    timeout=timeout, config=config)
+        (get_git_directory(path) / MAINTENANCE_MARKER).touch()
+    except GitTransportError as e:
+        error = str(e)
+    return path, tasks, start, time.perf_counter_ns(), os.getpid(), error
+
+
+def maintain_repositories(paths: List[Path], jobs: int = 2, cpus: Optional[int] = None,
+                          time_budget: Optional[float] = None, loose_objects_limit: int = LOOSE_OBJECTS_LIMIT,
+                          packs_limit: int = PACKS_LIMIT):
+    """
+    Runs the maintenance that each repository needs in a pool of jobs worker processes, at most one per CPU.
+
+    Each git process uses cpus / jobs threads for packing, so that the whole stage stays within cpus. Once
+    time_budget seconds have passed no more repositories are started, and the running ones are stopped at that
+    point.
+    """
+    cpus = cpus if cpus else os.cpu_count() or 1
+    # More jobs than CPUs would run more git processes than the CPUs of the budget, even with one thread each
+    jobs = min(jobs, cpus)
+    threads = cpus // jobs
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    planned = [(state, plan_maintenance(state, loose_objects_limit, packs_limit))
+               for state in map(get_repository_state, paths)]
+    pending = sorted(((state, tasks) for state, tasks in planned if tasks), key=lambda item: get_priority(item[0]),
+                     reverse=True)
+    record_maintenance("none", "skipped", len(planned) - len(pending))
+
+    running = set()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            while pending and len(running) < jobs:
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    break
+                state, tasks = pending.pop(0)
+                running.add(executor.submit(maintain_repository, state.path, tasks, threads, remaining))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, tasks, start, end, pid, error = future.result()
+                record_span("maintenance", "maintenance", start, end, f"maintenance worker {pid}", path=path,
+                            tasks=",".join(tasks))
+                if error:
+                    print(f"Error: {error}")
+                record_maintenance("+".join(tasks), "failed" if error else "done")
+                print(f"Maintenance of {path} ({', '.join(tasks)}) " + ("failed" if error else "done"))
+
+    for state, tasks in pending:
+        print(f"Maintenance of {state.path} skipped, the time budget was exhausted")
+        record_maintenance("+".join(tasks), "out_of_budget")
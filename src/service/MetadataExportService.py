@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.model.Repository import Repository
+from src.service.GitTransportService import GitTransportError
+from src.service.IOService import write_json_atomically
+from src.service.MetricsService import record_metadata_objects
+from src.service.ProviderService import ProviderService
+from src.service.TraceService import span
+
+# Name of the file with the cursors of the last export of each repo, kept in the backup folder
+CURSORS_NAME = ".metadata-cursors.json"
+# Seconds between saves of the cursors during an export, an interrupted export exports again at most what was exported
+# in that time
+CURSORS_SAVE_INTERVAL = 10
+
+
+def get_metadata_folder(path: Path) -> Path:
+    """Folder next to the clone of a repo where its metadata is exported."""
+    return path.with_name(path.name + ".metadata")
+
+
+def get_wiki_path(path: Path) -> Path:
+    return path.with_name(path.name + ".wiki")
+
+
+def get_cursors_key(repository: Repository) -> str:
+    """Key of the cursors of a repo, which does not depend on the backup name or the layout of the backup."""
+    return f"{repository.provider.url.rstrip('/')}/{repository.organization}/{repository.name}"
+
+
+def read_cursors(backup_folder) -> Dict[str, dict]:
+    """
+    Reads the cursors of the last export of each repo, by the key of get_cursors_key, as the path of the repo whose
+    metadata folder they describe and the cursor of each kind.
+    """
+    cursors_path = Path(backup_folder) / CURSORS_NAME
+    if not cursors_path.is_file():
+        return {}
+    with open(cursors_path) as file:
+        cursors = json.load(file)
+    # Older exports kept the cursors by path, and before that a cursor was only the time, without the objects already
+    # exported at that time
+    return {key: entry if "kinds" in entry else {
+        "path": key,
+        "kinds": {kind: cursor if isinstance(cursor, dict) else {"since": cursor, "ids": []}
+                  for kind, cursor in entry.items()},
+    } for key, entry in cursors.items()}
+
+
+def carry_over_metadata(previous_folder: Path, folder: Path, cursors: Dict[str, dict]) -> Dict[str, dict]:
+    """
+    Copies the exported metadata of previous_folder, the folder of the last export of a repo, into folder, so the
+    export into folder is complete even though it only fetches what changed since the cursors.
+
+    Returns:
+        dict: The cursors that still apply, without those of the kinds whose previous export is missing.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    kept = {}
+    for kind, cursor in cursors.items():
+        previous_file = previous_folder / f"{kind}.ndjson.gz"
+        if not previous_file.is_file():
+            continue
+        if previous_folder != folder:
+            # Even over a file already in folder, the cursor is the one of the previous file
+            shutil.copyfile(previous_file, folder / previous_file.name)
+        kept[kind] = cursor
+    return kept
+
+
+def export_kind(service: ProviderService, repository: Repository, kind: str, file_path: Path,
+                cursor: Optional[dict]) -> Tuple[int, Optional[dict]]:
+    """
+    Appends the objects of kind created or updated since the cursor to file_path, as a new gzip member of NDJSON.
+
+    Readers of the file see the concatenation of the members of every export, so an object updated between exports is
+    present once per export, and its last line is the latest version. The member is written to a separate file first
+    and appended once complete, so an interrupted export never leaves a truncated member in the middle of the file.
+
+    The cursor is the latest update time exported and the ids of the objects exported with that time. Providers
+    return the objects updated at the cursor time again, since times only have a precision of seconds, and those
+    already exported are skipped.
+
+    Returns:
+        tuple: Number of objects exported and the new cursor, the previous one if none.
+    """
+    since = cursor["since"] if cursor else None
+    seen = set(cursor["ids"]) if cursor else set()
+    part_path = file_path.with_name(file_path.name + ".part")
+    count = 0
+    latest = since
+    latest_ids = set(seen)
+    try:
+        with gzip.open(part_path, "wt", encoding="utf-8") as file:
+            for page in service.get_metadata_pages(repository.organization, repository.name, kind, since):
+                for item in page:
+                    updated = item.get("updated_at") or item.get("created_at")
+                    if updated and updated == since and item.get("id") in seen:
+                        continue
+                    file.write(json.dumps(item, separators=(",", ":"), sort_keys=True) + "\n")
+                    count += 1
+                    if updated and (latest is None or updated > latest):
+                        latest = updated
+                        latest_ids = set()
+                    if updated and updated == latest:
+                        latest_ids.add(item.get("id"))
+        if count:
+            with open(part_path, "rb") as source, open(file_path, "ab") as destination:
+                shutil.copyfileobj(source, destination)
+                destination.flush()
+                os.fsync(destination.fileno())
+    finally:
+        part_path.unlink(missing_ok=True)
+    if latest is None:
+        return count, cursor
+    return count, {"since": latest, "ids": sorted(latest_ids, key=str)}
+
+
+def export_repository_metadata(service: ProviderService, repository: Repository, path: Path,
+                               cursors: Dict[str, dict], timeout: Optional[float] = None) -> Dict[str, dict]:
+    """
+    Exports the metadata of the repo cloned in path into <path>.metadata/<kind>.ndjson.gz, only what changed since the
+    cursors of the previous export, and clones or fetches its wiki into <path>.wiki.
+
+    Returns:
+        dict: The cursors of the kinds exported successfully, to use in the next export.
+    """
+    folder = get_metadata_folder(path)
+    folder.mkdir(parents=True, exist_ok=True)
+    new_cursors = dict(cursors)
+    for kind in service.get_metadata_kinds():
+        try:
+            with span("export_" + kind, "metadata", repository=repository.link):
+                count, cursor = export_kind(service, repository, kind, folder / f"{kind}.ndjson.gz", cursors.get(kind))
+        except Exception as e:
+            print(f"Error: could not export {kind} of {repository.link}: {e}")
+            continue
+        record_metadata_objects(repository.provider.url, kind, count)
+        if cursor:
+            new_cursors[kind] = cursor
+    backup_wiki(service, repository, path, timeout)
+    return new_cursors
+
+
+def backup_wiki(service: ProviderService, repository: Repository, path: Path, timeout: Optional[float] = None):
+    """Clones or fetches the wiki of the repo cloned in path into <path>.wiki, if it has one."""
+    try:
+        wiki_url = service.get_wiki_url(repository.organization, repository.name)
+        if wiki_url:
+            with span("transfer_wiki", "metadata", repository=repository.link):
+                service.clone_repo(wiki_url, get_wiki_path(path), timeout)
+    except GitTransportError as e:
+        # Wikis are enabled by default but their repo only exists once the first page is written
+        if "not found" not in e.stderr.lower():
+            print(f"Error: could not back up the wiki of {repository.link}: {e}")
+    except Exception as e:
+        print(f"Error: could not back up the wiki of {repository.link}: {e}")
+
+
+def export_metadata(model: Dict[Path, Repository], backup_folder, services: Dict[object, ProviderService],
+                    jobs: int = 4, timeout: Optional[float] = None):
+    """
+    Exports the metadata of the repos in model, jobs repos at a time, with the service of the provider of each repo.
+
+    The cursors are kept by repo and not by path, so the next export only fetches what was updated after the latest
+    update seen by this one, even into the folder of a new backup, where the metadata of the last export is copied
+    first. A repo backed up for several users is exported once and copied to the others. The cursors are saved every
+    CURSORS_SAVE_INTERVAL seconds and at the end, only for the repos in model.
+    """
+    backup_folder = Path(backup_folder)
+    previous_cursors = read_cursors(backup_folder)
+    cursors = {}
+    lock = threading.Lock()
+    saved = [time.monotonic()]
+
+    def save(force: bool = False):
+        if force or time.monotonic() - saved[0] >= CURSORS_SAVE_INTERVAL:
+            # Cursors of this export first, then the previous ones of the repos not done yet
+            write_json_atomically(backup_folder / CURSORS_NAME, dict(previous_cursors, **cursors))
+            saved[0] = time.monotonic()
+
+    def export(group: List[Tuple[Path, Repository]]):
+        key, repository = group[0]
+        service = services[repository.provider]
+        cursors_key = get_cursors_key(repository)
+        path = backup_folder / key
+        entry = previous_cursors.get(cursors_key) or previous_cursors.get(Path(key).as_posix())
+        repository_cursors = {}
+        if entry:
+            repository_cursors = carry_over_metadata(get_metadata_folder(backup_folder / entry["path"]),
+                                                     get_metadata_folder(path), entry["kinds"])
+        with span("export_metadata", "metadata", repository=repository.link):
+            repository_cursors = export_repository_metadata(service, repository, path, repository_cursors, timeout)
+        for other_key, other_repository in group[1:]:
+            other_path = backup_folder / other_key
+            shutil.copytree(get_metadata_folder(path), get_metadata_folder(other_path), dirs_exist_ok=True)
+            backup_wiki(service, other_repository, other_path, timeout)
+        with lock:
+            cursors[cursors_key] = {"path": Path(key).as_posix(), "kinds": repository_cursors}
+            save()
+
+    groups = {}
+    for key, repository in model.items():
+        groups.setdefault(get_cursors_key(repository), []).append((key, repository))
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="metadata") as executor:
+        list(executor.map(export, groups.values()))
+    # Cursors of repos that are not in model any more are dropped
+    previous_cursors = {}
+    save(force=True)
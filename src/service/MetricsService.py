@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, disable_created_metrics, \
+    start_http_server, write_to_textfile
+
+# Counters would otherwise carry a *_created sample per label set, which is noise in a textfile of a batch run
+disable_created_metrics()
+
+# Own registry so that only the backup metrics are exported, not the default process / platform collectors
+REGISTRY = CollectorRegistry()
+
+API_REQUESTS = Counter("github_backup_api_requests_total",
+                       "Number of API calls made against a provider.",
+                       ["provider", "endpoint"],
+                       registry=REGISTRY)
+API_REQUEST_DURATION = Histogram("github_backup_api_request_duration_seconds",
+                                 "Latency of the API calls made against a provider, including paging.",
+                                 ["provider", "endpoint"],
+                                 buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+                                 registry=REGISTRY)
+RATE_LIMIT_WAITS = Counter("github_backup_rate_limit_waits_total",
+                           "Number of times the backup had to wait for the API rate limit to reset.",
+                           ["provider"],
+                           registry=REGISTRY)
+RATE_LIMIT_WAIT_SECONDS = Counter("github_backup_rate_limit_wait_seconds_total",
+                                  "Time spent waiting for the API rate limit to reset.",
+                                  ["provider"],
+                                  registry=REGISTRY)
+REPOSITORIES = Counter("github_backup_repositories_total",
+                       "Repositories processed, by status (discovered, skipped, cloned, failed).",
+                       ["provider", "status"],
+                       registry=REGISTRY)
+RECEIVED_BYTES = Counter("github_backup_received_bytes_total",
+                         "Bytes received when cloning repositories.",
+                         ["provider"],
+                         registry=REGISTRY)
+CLONE_DURATION = Histogram("github_backup_clone_duration_seconds",
+                           "Time spent cloning a single repository.",
+                           ["provider"],
+                           buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+                           registry=REGISTRY)
+LFS_OBJECTS = Counter("github_backup_lfs_objects_total",
+                      "LFS objects referenced by the backed up repositories, by status (present, fetched, failed).",
+                      ["status"],
+                      registry=REGISTRY)
+LFS_RECEIVED_BYTES = Counter("github_backup_lfs_received_bytes_total",
+                             "Bytes of the LFS objects downloaded into the shared store.",
+                             registry=REGISTRY)
+MAINTENANCE_RUNS = Counter("github_backup_maintenance_repositories_total",
+                           "Repositories considered by the maintenance stage, by tasks and status (skipped, done, "
+                           "failed, out_of_budget).",
+                           ["tasks", "status"],
+                           registry=REGISTRY)
+VERIFICATIONS = Counter("github_backup_verification_checks_total",
+                        "Checks run by the verification of the backup, by kind (fsck, pack, refs) and status (passed, "
+                        "failed).",
+                        ["kind", "status"],
+                        registry=REGISTRY)
+METADATA_OBJECTS = Counter("github_backup_metadata_objects_total",
+                           "Issues, pull requests, comments and releases exported, by kind.",
+                           ["provider", "kind"],
+                           registry=REGISTRY)
+UPLOADS = Counter("github_backup_uploads_total",
+                  "Repositories uploaded to the storage, by status (uploaded, skipped, empty, failed).",
+                  ["status"],
+                  registry=REGISTRY)
+UPLOADED_BYTES = Counter("github_backup_uploaded_bytes_total",
+                         "Bytes of the bundles uploaded to the storage.",
+                         registry=REGISTRY)
+TOKEN_CALLS = Counter("github_backup_token_api_requests_total",
+                      "Number of API calls made with each token of the pool of a provider.",
+                      ["provider", "token"],
+                      registry=REGISTRY)
+TOKEN_REMAINING = Gauge("github_backup_token_rate_limit_remaining",
+                        "Remaining API rate limit budget of each token of the pool of a provider.",
+                        ["provider", "token"],
+                        registry=REGISTRY)
+PHASE_DURATION = Gauge("github_backup_phase_duration_seconds",
+                       "Duration of each phase of the last backup run.",
+                       ["phase"],
+                       registry=REGISTRY)
+LAST_RUN_TIMESTAMP = Gauge("github_backup_last_run_timestamp_seconds",
+                           "Unix time at which the last backup run finished.",
+                           registry=REGISTRY)
+LAST_RUN_SUCCESS = Gauge("github_backup_last_run_success",
+                         "1 if the last backup run finished without errors, 0 if it failed or was interrupted.",
+                         registry=REGISTRY)
+
+
+@contextmanager
+def observe_api_request(provider: str, endpoint: str):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        API_REQUESTS.labels(provider, endpoint).inc()
+        API_REQUEST_DURATION.labels(provider, endpoint).observe(time.monotonic() - start)
+
+
+@contextmanager
+def observe_phase(phase: str):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        PHASE_DURATION.labels(phase).set(time.monotonic() - start)
+
+
+def record_rate_limit_wait(provider: str, seconds: float):
+    RATE_LIMIT_WAITS.labels(provider).inc()
+    RATE_LIMIT_WAIT_SECONDS.labels(provider).inc(seconds)
+
+
+def record_lfs_objects(present: int, fetched: int, received_bytes: int, failed: int = 0):
+    LFS_OBJECTS.labels("present").inc(present)
+    LFS_OBJECTS.labels("fetched").inc(fetched)
+    LFS_OBJECTS.labels("failed").inc(failed)
+    LFS_RECEIVED_BYTES.inc(received_bytes)
+
+
+def record_maintenance(tasks: str, status: str, count: int = 1):
+    MAINTENANCE_RUNS.labels(tasks, status).inc(count)
+
+
+def record_verification(kind: str, status: str):
+    VERIFICATIONS.labels(kind, status).inc()
+
+
+def record_metadata_objects(provider: str, kind: str, count: int):
+    METADATA_OBJECTS.labels(provider, kind).inc(count)
+
+
+def record_upload(status: str, uploaded_bytes: int):
+    UPLOADS.labels(status).inc()
+    UPLOADED_BYTES.inc(uploaded_bytes)
+
+
+def record_token_usage(provider: str, token):
+    # Tokens are identified by their position in the pool, never by their value
+    TOKEN_CALLS.labels(provider, str(token.index)).inc()
+    if token.remaining is not None:
+        TOKEN_REMAINING.labels(provider, str(token.index)).set(token.remaining)
+
+
+def record_repository(provider: str, status: str):
+    REPOSITORIES.labels(provider, status).inc()
+
+
+def record_clone(provider: str, seconds: float, received_bytes: int):
+    CLONE_DURATION.labels(provider).observe(seconds)
+    RECEIVED_BYTES.labels(provider).inc(received_bytes)
+
+
+def start_metrics_server(port: int):
+    """
+    Serves the metrics over HTTP in a daemon thread for the lifetime of the process, so they can only be scraped
+    while the run lasts. Scheduled runs should use write_metrics_textfile.
+    """
+    start_http_server(port, registry=REGISTRY)
+
+
+def write_metrics_textfile(file_path: str, succeeded: bool = True):
+    """Writes the metrics in the node_exporter textfile collector format. The file is replaced atomically."""
+    LAST_RUN_TIMESTAMP.set_to_current_time()
+    LAST_RUN_SUCCESS.set(1 if succeeded else 0)
+    write_to_textfile(file_path, REGISTRY)
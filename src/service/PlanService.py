@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.defines.FlattenLevel import FlattenLevel
+from src.model.Repository import Repository
+
+
+def format_layout(model: Dict[str, Repository], skipped: List[Repository]) -> str:
+    """Path of each repo in the backup and where it is cloned from, sorted by path, then the repos left out."""
+    lines = [f"{path}   {model[path].link}" for path in sorted(model)]
+    lines.extend(f"Skipped {repository.link}, its path is taken by another repository" for repository in skipped)
+    lines.append(f"{len(model)} repositories planned, {len(skipped)} skipped")
+    return "\n".join(lines) + "\n"
+
+
+def get_plan_folders(backup_name: str, usernames: Optional[List[str]], flatten_directories: List[str]) -> List[str]:
+    """
+    Folders, relative to the backup folder, that hold the repos a plan can lay out, so that the diff does not report
+    the repos of other backups or of other users as no longer planned. The whole backup folder if the backups are not
+    kept in a folder of their own.
+    """
+    if FlattenLevel.ROOT.name in flatten_directories:
+        prefixes = [""]
+    else:
+        prefixes = [backup_name]
+    if usernames and FlattenLevel.USER.name not in flatten_directories:
+        prefixes = [f"{prefix}/{username}".lstrip("/") for prefix in prefixes for username in usernames]
+    return prefixes
+
+
+def diff_layout(planned: Dict[str, str], on_disk: Iterable[str],
+                previous: Dict[str, str]) -> Tuple[List[str], List[Tuple[str, str]], List[str], int]:
+    """
+    Compares the planned layout, the link of each path, with the repos on disk. A repo whose link was cloned into
+    another path that is still on disk, according to previous, the paths of the links in the last backup, was moved.
+    Wikis are cloned next to their repo, so they are neither compared nor reported.
+
+    Returns:
+        tuple: The paths to clone, the moves from an old path to a new one, the paths on disk that are no longer
+        planned and the number of paths that are already on disk.
+    """
+    on_disk = set(on_disk)
+    on_disk -= {path for path in on_disk if path.endswith(".wiki") and (path[:-5] in on_disk or path[:-5] in planned)}
+    added = []
+    moved = []
+    moved_from: Set[str] = set()
+    unchanged = 0
+    for path in sorted(planned):
+        if path in on_disk:
+            unchanged += 1
+            continue
+        old_path = previous.get(planned[path])
+        if old_path and old_path != path and old_path in on_disk and old_path not in planned \
+                and old_path not in moved_from:
+            moved.append((old_path, path))
+            moved_from.add(old_path)
+        else:
+            added.append(path)
+    removed = sorted(path for path in on_disk if path not in planned and path not in moved_from)
+    return added, moved, removed, unchanged
+
+
+def format_diff(planned: Dict[str, str], added: List[str], moved: List[Tuple[str, str]], removed: List[str],
+                unchanged: int) -> str:
+    lines = [f"+ {path}   {planned[path]}" for path in added]
+    lines.extend(f"~ {old_path} -> {path}   {planned[path]}" for old_path, path in moved)
+    lines.extend(f"- {path}" for path in removed)
+    lines.append(f"{len(added)} to clone, {len(moved)} moved, {len(removed)} no longer planned, {unchanged} unchanged")
+    return "\n".join(lines) + "\n"
+
@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterator, List, Optional
 
 from src.model.Provider import Provider
-from src.service.TokenService import get_custom_provider_token
+from src.model.TransferStats import TransferStats
+from src.service.GitTransportService import transfer
+from src.service.TokenService import get_custom_provider_tokens
 
 
 class ProviderService(ABC):
@@ -20,16 +22,36 @@ class ProviderService(ABC):
     def get_organization_repo_names(self, organization) -> List[str]:
         pass
 
-    def clone_repo(self, url, path):
-        pass
+    def clone_repo(self, url, path, timeout=None, cancel_event=None, progress=None) -> TransferStats:
+        """Clones the repo in url into path, or fetches it if it was already cloned there."""
+        return transfer(url, path, timeout, cancel_event, progress)
 
     def get_user_organizations(self):
         pass
 
+    def get_metadata_kinds(self) -> List[str]:
+        """Kinds of repo metadata that the provider can export, such as issues or releases."""
+        return []
+
+    def get_metadata_pages(self, organization, name, kind, since=None) -> Iterator[List[dict]]:
+        """
+        Yields pages of the objects of kind of a repo, as returned by the API of the provider. If since is given, only
+        the objects created or updated at or after that ISO 8601 time are yielded.
+        """
+        return iter([])
+
+    def get_wiki_url(self, organization, name) -> Optional[str]:
+        """URL of the git repo of the wiki of a repo, None if it has no wiki."""
+        pass
+
+
+def build_provider(provider_type, url, token, tokens=None):
+    return Provider(provider_type, url, token, tokens)
+
 
-def build_provider(provider_type, url, token):
-    return Provider(provider_type, url, token)
+def build_pooled_provider(provider_type, url, tokens):
+    return Provider(provider_type, url, tokens[0], tokens)
 
 
 def build_custom_provider(provider_type, url):
-    return Provider(provider_type, url, get_custom_provider_token(provider_type, url))
+    return build_pooled_provider(provider_type, url, get_custom_provider_tokens(provider_type, url))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from src.defines.ProviderType import ProviderType
+from src.model.Provider import Provider
+from src.model.Repository import Repository
+from src.service.IOService import write_json_atomically
+
+# Name of the report of the last backup, always kept in the backup folder so that restore can find it
+STATE_NAME = ".backup-state.json"
+REPORT_VERSION = 1
+# Name of the file with the repos found by the last discovery, before their paths are resolved, so --plan works offline
+DISCOVERY_CACHE_NAME = ".discovery-cache.json"
+DISCOVERY_CACHE_VERSION = 1
+
+
+def build_report(backup_name: str, backup_folder, model: Dict[Path, Repository], failed: Iterable[Path] = ()) -> dict:
+    """Report of a backup: where each repo was cloned from, where it was cloned to and whether it succeeded."""
+    failed = set(failed)
+    return {
+        "version": REPORT_VERSION,
+        "backup_name": backup_name,
+        "backup_folder": os.path.abspath(backup_folder),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "repositories": [{
+            "path": Path(key).as_posix(),
+            "user": repository.owner,
+            "provider": repository.provider.provider.name,
+            "provider_url": repository.provider.url,
+            "organization": repository.organization,
+            "name": repository.name,
+            "link": repository.link,
+            "status": "failed" if key in failed else "cloned",
+        } for key, repository in model.items()],
+    }
+
+
+def write_report(file_path, report: dict):
+    write_json_atomically(file_path, report)
+
+
+def read_report(file_path) -> dict:
+    """
+    Reads a backup report.
+
+    Raises:
+        FileNotFoundError: If the report does not exist.
+        ValueError: If it is not a report or was written by an incompatible version.
+    """
+    with open(file_path) as file:
+        report = json.load(file)
+    if not isinstance(report, dict) or report.get("version") != REPORT_VERSION:
+        raise ValueError(f"{file_path} is not a backup report of a compatible version")
+    return report
+
+
+def write_discovery_cache(file_path, backup_name: str, repositories: List[Repository]):
+    write_json_atomically(file_path, {
+        "version": DISCOVERY_CACHE_VERSION,
+        "backup_name": backup_name,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "repositories": [{
+            "user": repository.owner,
+            "provider": repository.provider.provider.name,
+            "provider_url": repository.provider.url,
+            "organization": repository.organization,
+            "name": repository.name,
+            "link": repository.link,
+        } for repository in repositories],
+    })
+
+
+def read_discovery_cache(file_path, backup_name: Optional[str] = None) -> List[Repository]:
+    """
+    Reads the repos discovered by a backup, in the order they were discovered, as part of a backup named backup_name
+    or the name of that backup. Their providers have no tokens, they are only meant to compute paths.
+
+    Raises:
+        FileNotFoundError: If the cache does not exist.
+        ValueError: If it is not a discovery cache or was written by an incompatible version.
+    """
+    with open(file_path) as file:
+        cache = json.load(file)
+    if not isinstance(cache, dict) or cache.get("version") != DISCOVERY_CACHE_VERSION:
+        raise ValueError(f"{file_path} is not a discovery cache of a compatible version")
+    backup_name = backup_name if backup_name else cache["backup_name"]
+    providers = {}
+    repositories = []
+    for entry in cache["repositories"]:
+        key = (entry["provider"], entry["provider_url"])
+        if key not in providers:
+            providers[key] = Provider(ProviderType[entry["provider"]], entry["provider_url"], None)
+        repositories.append(Repository(backup_name, entry["user"], providers[key], entry["organization"],
+                                       entry["name"], entry["link"]))
+    return repositories
@@ -1,34 +1,141 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import os
 from pathlib import Path
+from typing import Dict, List, Tuple
 
 from src.defines.FlattenLevel import FlattenLevel
+from src.defines.RenameStrategy import RenameStrategy
+from src.model.Repository import Repository
+from src.service.TraceService import span
 
+# Levels whose names are added to the name of a repo, one more each time, to avoid a collision with another repo
+RENAME_LEVELS = [FlattenLevel.ORGANIZATION, FlattenLevel.PROVIDER, FlattenLevel.USER, FlattenLevel.ROOT]
 
-def compute_path(repository, ignore_backup: bool = False, ignore_owner: bool = False, ignore_provider: bool = False,
-                 ignore_organization: bool = False, flatten_level: FlattenLevel = FlattenLevel.REPO):
+
+def get_path_parts(repository, ignore_backup: bool = False, ignore_owner: bool = False, ignore_provider: bool = False,
+                   ignore_organization: bool = False, flatten_level: FlattenLevel = FlattenLevel.REPO) -> List[str]:
     separator = "__"
-    repository.path = Path()
+    provider = repository.provider.provider.name
+    parts = []
     if not ignore_backup:
-        repository.path = repository.path / repository.backup
+        parts.append(repository.backup)
     if not ignore_owner:
-        repository.path = repository.path / repository.owner
+        parts.append(repository.owner)
     if not ignore_provider:
-        repository.path = repository.path / repository.provider.provider.name
+        parts.append(provider)
     if not ignore_organization:
-        repository.path = repository.path / repository.organization
-
-    if flatten_level == FlattenLevel.REPO:
-        repository.path = repository.path / repository.name
-    elif flatten_level == FlattenLevel.ORGANIZATION:
-        repository.path = repository.path / repository.name + separator + repository.organization
-    elif flatten_level == FlattenLevel.PROVIDER:
-        repository.path = (repository.path / repository.name + separator + repository.organization + separator +
-                           repository.provider)
-    elif flatten_level == FlattenLevel.USER:
-        repository.path = (repository.path / repository.name + separator + repository.organization + separator +
-                           repository.provider + separator + repository.user)
-    elif flatten_level == FlattenLevel.ROOT:
-        repository.path = (repository.path / repository.name + separator + repository.organization + separator +
-                           repository.provider + separator + repository.user + separator + repository.backup)
+        parts.append(repository.organization)
+
+    # Each level up adds the name of one more level of the hierarchy to the name of the repo
+    suffixes = (repository.organization, provider, repository.owner, repository.backup)
+    name = separator.join((repository.name,) + suffixes[:FlattenLevel.REPO.value - flatten_level.value])
+    parts.append(name)
+    return parts
+
+
+def resolve_path_names(repositories: List[Repository], flatten_directories: List[str],
+                       rename_strategy: RenameStrategy) -> Tuple[Dict[str, Repository], List[Repository]]:
+    """
+    Computes the path of each repository in the backup, as a POSIX path relative to the backup folder, and resolves
+    the paths shared by several of them with rename_strategy. It only uses the discovered repositories, so it can be
+    run offline. Paths are compared as strings, which is several times faster than as Path for large backups.
+
+    Repositories whose path is not shared keep it. Of the repositories that share a path, with IGNORE the first one
+    keeps it and the others are skipped, with SHORTEST the first one keeps it and each of the others gets the shortest
+    name that is still free, with SYSTEMATIC all of them get the full name and with SHORTEST_SYSTEMATIC all of them
+    get the shortest name at which they are all different.
+
+    Returns:
+        tuple: The repositories by path, and the repositories that were left out because of a collision.
+    """
+    flags = [level.name in flatten_directories for level in
+             (FlattenLevel.ROOT, FlattenLevel.USER, FlattenLevel.PROVIDER, FlattenLevel.ORGANIZATION)]
+
+    def compute(repository, level):
+        return "/".join(get_path_parts(repository, *flags, level))
+
+    model = {}
+    skipped = []
+
+    def place(repository, levels):
+        # Takes the first level whose path is still free
+        with span("resolve_collision", "path", organization=repository.organization, repository=repository.name):
+            for level in levels:
+                path = compute(repository, level)
+                if path not in model:
+                    model[path] = repository
+                    return
+            skipped.append(repository)
+
+    groups = {}
+    for repository in repositories:
+        with span("resolve_path", "path", organization=repository.organization, repository=repository.name):
+            groups.setdefault(compute(repository, FlattenLevel.REPO), []).append(repository)
+    # Repositories without collisions first, so that a renamed repository never takes their path
+    for path, group in groups.items():
+        if len(group) == 1:
+            model[path] = group[0]
+
+    for path, group in groups.items():
+        if len(group) == 1:
+            continue
+        if rename_strategy == RenameStrategy.IGNORE:
+            model[path] = group[0]
+            skipped.extend(group[1:])
+        elif rename_strategy == RenameStrategy.SHORTEST:
+            model[path] = group[0]
+            for repository in group[1:]:
+                place(repository, RENAME_LEVELS)
+        elif rename_strategy == RenameStrategy.SYSTEMATIC:
+            for repository in group:
+                place(repository, [FlattenLevel.ROOT])
+        else:
+            # SHORTEST_SYSTEMATIC: the shortest level at which all the repositories of the group have different paths
+            levels = RENAME_LEVELS
+            for index, level in enumerate(RENAME_LEVELS):
+                paths = {compute(repository, level) for repository in group}
+                if len(paths) == len(group) and not any(path in model for path in paths):
+                    levels = RENAME_LEVELS[index:]
+                    break
+            for repository in group:
+                place(repository, levels)
+    return model, skipped
+
+
+def resolve_paths(repositories: List[Repository], flatten_directories: List[str],
+                  rename_strategy: RenameStrategy) -> Tuple[Dict[Path, Repository], List[Repository]]:
+    """Same as resolve_path_names, by Path, with the path of each repository set to it."""
+    names, skipped = resolve_path_names(repositories, flatten_directories, rename_strategy)
+    model = {}
+    for name, repository in names.items():
+        repository.path = Path(name)
+        model[repository.path] = repository
+    return model, skipped
+
+
+def find_git_repository_names(folder) -> List[str]:
+    """
+    Lists the git repositories (clones and bare repositories) under folder, without looking inside them, as POSIX
+    paths relative to folder. Hidden folders, such as the shared LFS store, are skipped.
+    """
+    names = []
+
+    def walk(directory, prefix):
+        with os.scandir(directory) as iterator:
+            entries = {entry.name: entry for entry in iterator}
+        if ".git" in entries or ("objects" in entries and "HEAD" in entries and entries["objects"].is_dir()
+                                 and not entries["HEAD"].is_dir()):
+            names.append(prefix.rstrip("/") or ".")
+            return
+        for name in sorted(entries):
+            if not name.startswith(".") and entries[name].is_dir():
+                walk(entries[name].path, prefix + name + "/")
+
+    walk(folder, "")
+    return names
+
 
+def find_git_repositories(folder) -> List[Path]:
+    """Same as find_git_repository_names, as paths under folder."""
+    return [Path(folder) / name for name in find_git_repository_names(folder)]
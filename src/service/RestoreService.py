@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import fnmatch
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from src.model.TransferStats import TransferStats
+from src.service.GitTransportService import GitTransportError, clone, is_git_repository, run_git, run_transfer
+from src.service.LfsService import is_lfs_available
+from src.service.TraceService import span
+
+# Refs pushed by each git push of a mirror, to stay well below the limit of the length of a command line
+PUSH_BATCH_SIZE = 1000
+
+
+def select_repositories(repositories: List[dict], backup_folder, users: Optional[List[str]] = None,
+                        organizations: Optional[List[str]] = None, globs: Optional[List[str]] = None) -> List[dict]:
+    """
+    Returns the repos of a backup report that are in backup_folder and match the selection. A repo matches if it
+    matches any of the values of each criteria that is given.
+
+    The status of a repo in the report is not used: a repo whose last fetch failed still has the clone of an earlier
+    backup, which can be restored.
+    """
+    backup_folder = Path(backup_folder)
+    selected = []
+    for repository in repositories:
+        if not is_git_repository(backup_folder / repository["path"]):
+            continue
+        if users and repository["user"] not in users:
+            continue
+        if organizations and repository["organization"] not in organizations:
+            continue
+        if globs and not any(fnmatch.fnmatchcase(repository["organization"] + "/" + repository["name"], pattern)
+                             or fnmatch.fnmatchcase(repository["path"], pattern) for pattern in globs):
+            continue
+        selected.append(repository)
+    return selected
+
+
+def deduplicate_repositories(repositories: List[dict]) -> List[dict]:
+    """
+    Keeps the first of the repos with the same link, such as the repos of an organization backed up for each of its
+    users, which would otherwise be restored several times into the same target.
+    """
+    links = set()
+    unique = []
+    for repository in repositories:
+        if repository["link"] not in links:
+            links.add(repository["link"])
+            unique.append(repository)
+    return unique
+
+
+def find_target_collisions(repositories: List[dict], targets: List) -> Dict[str, List[str]]:
+    """Returns the links of the repos that would be restored into each target shared by several repos."""
+    links_per_target = {}
+    for repository, target in zip(repositories, targets):
+        links_per_target.setdefault(str(target), []).append(repository["link"])
+    return {target: links for target, links in links_per_target.items() if len(links) > 1}
+
+
+def format_template(template: str, repository: dict) -> str:
+    return template.format(user=repository["user"], provider=repository["provider"].lower(),
+                           organization=repository["organization"], name=repository["name"], path=repository["path"])
+
+
+def check_lfs_store(lfs_store: Optional[Path]):
+    if lfs_store is None:
+        return
+    if not lfs_store.is_dir():
+        raise GitTransportError(f"the LFS store {lfs_store} does not exist, supply the store of the backup with "
+                                f"--lfs-store")
+    if not is_lfs_available():
+        raise GitTransportError("its LFS objects cannot be restored because git-lfs is not installed")
+
+
+def restore_working_tree(source: Path, destination: Path, link: str, lazy: bool = False,
+                         sparse_directories: Optional[List[str]] = None, timeout: Optional[float] = None,
+                         lfs_store: Optional[Path] = None):
+    """
+    Clones the backup in source into a working tree in destination, with all the branches of the backed up repo as
+    remote-tracking branches of origin, which points to link again.
+
+    The clone is made without checkout, and only then the sparse-checkout is set up and the files are checked out, by
+    several workers, so that the files outside of the sparse-checkout are never written. If lazy, it is a partial
+    clone without file contents, which are copied from the backup, its promisor remote, only as they are checked out.
+
+    If lfs_store is given, the working tree uses it as its LFS storage, as the backup does, and the LFS files are
+    checked out from it instead of being left as pointer files.
+    """
+    if destination.exists() and any(destination.iterdir()):
+        raise GitTransportError(f"{destination} already exists and is not empty")
+    check_lfs_store(lfs_store)
+    options = ["--no-checkout", "--origin", "backup"]
+    if lazy:
+        options.append("--filter=blob:none")
+    # file:// instead of a plain path, local clones hardlink the objects and ignore --filter
+    clone(source.absolute().as_uri(), destination, timeout=timeout, options=options)
+
+    try:
+        # A backup is a clone itself, so the branches of the backed up repo are its remote-tracking branches
+        branches = run_git(["for-each-ref", "--format=%(refname)", "refs/remotes/origin"], cwd=str(source)).stdout
+        refspecs = [f"+{ref}:{ref}" for ref in branches.split() if ref != "refs/remotes/origin/HEAD"]
+        if refspecs:
+            run_git(["fetch", "--quiet", "backup"] + refspecs, cwd=str(destination), timeout=timeout)
+        run_git(["remote", "add", "origin", link], cwd=str(destination))
+
+        if lfs_store:
+            run_git(["config", "lfs.storage", str(lfs_store)], cwd=str(destination))
+        if sparse_directories:
+            run_git(["sparse-checkout", "set", "--cone"] + sparse_directories, cwd=str(destination))
+        head = run_git(["symbolic-ref", "--quiet", "--short", "HEAD"], cwd=str(destination), check=False).stdout.strip()
+        has_commits = run_git(["rev-parse", "--verify", "--quiet", "HEAD"], cwd=str(destination),
+                              check=False).returncode == 0
+        if head and has_commits:
+            run_transfer(["checkout", "--progress", head], TransferStats(link, destination, "checkout"),
+                         cwd=str(destination), timeout=timeout)
+            if lfs_store:
+                # The checkout skips the LFS filter and writes pointer files, which are replaced by the objects
+                run_git(["lfs", "checkout"], cwd=str(destination), timeout=timeout)
+            if f"refs/remotes/origin/{head}" in branches.split():
+                run_git(["branch", "--quiet", f"--set-upstream-to=origin/{head}"], cwd=str(destination))
+    except BaseException:
+        # So that the restore can be retried
+        shutil.rmtree(destination, ignore_errors=True)
+        raise
+
+
+def push_mirror(source: Path, url: str, timeout: Optional[float] = None, lfs_store: Optional[Path] = None):
+    """
+    Pushes all the branches and tags of the backup in source to url, overwriting them, and its LFS objects from
+    lfs_store if it is given.
+    """
+    check_lfs_store(lfs_store)
+    stats = TransferStats(url, source, "push")
+    if lfs_store:
+        # Before the refs, so a server that checks the LFS objects of pushed commits finds them
+        run_git(["lfs", "push", "--all", url], cwd=str(source), timeout=timeout,
+                config={"lfs.storage": str(lfs_store)})
+    if run_git(["rev-parse", "--is-bare-repository"], cwd=str(source)).stdout.strip() == "true":
+        # A mirror already has the branches of the backed up repo as its own branches
+        run_transfer(["push", "--progress", "--mirror", url], stats, cwd=str(source), timeout=timeout)
+        return
+
+    refs = run_git(["for-each-ref", "--format=%(refname)", "refs/remotes/origin"], cwd=str(source)).stdout.split()
+    refspecs = [f"+{ref}:refs/heads/{ref[len('refs/remotes/origin/'):]}" for ref in refs
+                if ref != "refs/remotes/origin/HEAD"]
+    refspecs.append("+refs/tags/*:refs/tags/*")
+    for start in range(0, len(refspecs), PUSH_BATCH_SIZE):
+        run_transfer(["push", "--progress", url] + refspecs[start:start + PUSH_BATCH_SIZE], stats, cwd=str(source),
+                     timeout=timeout)
+
+
+def restore_repositories(repositories: List[dict], backup_folder, restore: Callable[[dict, Path], str],
+                         jobs: int = 4) -> int:
+    """
+    Restores the repos jobs at a time with restore, which receives the repo from the report and its path in the backup
+    and returns a description of where it was restored.
+
+    Returns:
+        int: Number of repos that could not be restored.
+    """
+    backup_folder = Path(backup_folder)
+
+    def restore_repository(repository):
+        source = backup_folder / repository["path"]
+        try:
+            if not is_git_repository(source):
+                raise GitTransportError(f"{source} is not a git repository")
+            with span("restore", "restore", repository=repository["link"]):
+                print(f"Restored {repository['link']} into {restore(repository, source)}")
+            return True
+        except GitTransportError as e:
+            print(f"Error: could not restore {repository['link']}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="restore") as executor:
+        results = list(executor.map(restore_repository, repositories))
+    return results.count(False)
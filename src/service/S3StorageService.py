@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import BinaryIO, Optional
+
+from src.service.StorageService import DEFAULT_PART_SIZE, StorageError, StorageService
+
+# Smallest part size accepted by S3 for all the parts but the last one
+MINIMUM_PART_SIZE = 5 * 1024 ** 2
+
+
+class S3StorageService(StorageService):
+    """
+    Storage in a bucket of S3 or of any S3-compatible server, such as MinIO with endpoint_url. Credentials are taken
+    from the usual places of boto3, such as the AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 part_size: int = DEFAULT_PART_SIZE, concurrency: int = 4):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise StorageError("Uploading to S3 requires boto3, install it with pip install boto3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, MINIMUM_PART_SIZE)
+        self.concurrency = concurrency
+        # The client is shared by all the uploads, which run concurrently, and by the parts of each of them
+        self.client = boto3.client("s3", endpoint_url=endpoint_url,
+                                   config=Config(max_pool_connections=max(concurrency * 4, 10),
+                                                 retries={"max_attempts": 5, "mode": "standard"}))
+
+    def _get_object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import BotoCoreError, ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._get_object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise StorageError(f"Could not check s3://{self.bucket}/{self._get_object_key(key)}: {e}")
+        except BotoCoreError as e:
+            # Such as an unreachable endpoint or missing credentials
+            raise StorageError(f"Could not check s3://{self.bucket}/{self._get_object_key(key)}: {e}")
+
+    def upload(self, key: str, stream: BinaryIO) -> int:
+        """
+        Uploads stream as a single object if it fits in a part, or else as a multipart upload whose parts are uploaded
+        concurrently while the next ones are read. At most concurrency parts are held in memory at once.
+        """
+        from botocore.exceptions import BotoCoreError, ClientError
+        object_key = self._get_object_key(key)
+        data = stream.read(self.part_size)
+        try:
+            if len(data) < self.part_size:
+                # Read to the end, so that a failure of the producer of stream is raised before storing anything
+                data += stream.read()
+                self.client.put_object(Bucket=self.bucket, Key=object_key, Body=data)
+                return len(data)
+            upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=object_key)["UploadId"]
+        except (BotoCoreError, ClientError) as e:
+            raise StorageError(f"Could not upload s3://{self.bucket}/{object_key}: {e}")
+
+        size = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-part") as executor:
+                futures = []
+                running = set()
+                part_number = 1
+                while data:
+                    if len(running) >= self.concurrency:
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        # Stop reading as soon as a part fails
+                        for done_future in done:
+                            done_future.result()
+                    future = executor.submit(self._upload_part, object_key, upload_id, part_number, data)
+                    futures.append(future)
+                    running.add(future)
+                    size += len(data)
+                    part_number += 1
+                    data = stream.read(self.part_size)
+                parts = [future.result() for future in futures]
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                                                  MultipartUpload={"Parts": parts})
+        except BaseException as e:
+            # Parts of aborted uploads would otherwise be stored and billed until a lifecycle rule removes them
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+            if isinstance(e, (BotoCoreError, ClientError)):
+                raise StorageError(f"Could not upload s3://{self.bucket}/{object_key}: {e}")
+            raise
+        return size
+
+    def _upload_part(self, object_key: str, upload_id: str, part_number: int, data: bytes) -> dict:
+        response = self.client.upload_part(Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                                           PartNumber=part_number, Body=data)
+        return {"ETag": response["ETag"], "PartNumber": part_number}
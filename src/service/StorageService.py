@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import shutil
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional
+from urllib.parse import urlparse
+
+from src.model.Repository import Repository
+from src.service.GitTransportService import GitOutputStream, is_git_repository, run_git
+from src.service.MetadataExportService import get_metadata_folder, get_wiki_path
+from src.service.MetricsService import record_upload
+from src.service.TraceService import span
+
+# Default size of the parts of multipart uploads. S3 allows up to 10000 parts, so 64 MiB parts fit bundles of 625 GiB
+DEFAULT_PART_SIZE = 64 * 1024 ** 2
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageService(ABC):
+    """Interface for the remote storages where the repos are uploaded once they are backed up."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def upload(self, key: str, stream: BinaryIO) -> int:
+        """
+        Uploads the content of stream under key as it is read and returns its size. Nothing is stored if reading stream
+        fails.
+        """
+        pass
+
+
+class LocalStorageService(StorageService):
+    """Storage in a local folder, such as a mounted network share."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+
+    def exists(self, key: str) -> bool:
+        return (self.folder / key).is_file()
+
+    def upload(self, key: str, stream: BinaryIO) -> int:
+        path = self.folder / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name(path.name + ".part")
+        try:
+            with open(temporary_path, "wb") as file:
+                shutil.copyfileobj(stream, file, 1024 ** 2)
+            os.replace(temporary_path, path)
+        finally:
+            if temporary_path.exists():
+                temporary_path.unlink()
+        return path.stat().st_size
+
+
+def build_storage_service(url: str, endpoint_url: Optional[str] = None, part_size: int = DEFAULT_PART_SIZE,
+                          concurrency: int = 4) -> StorageService:
+    """Builds the storage of url, which is either s3://bucket/prefix or a local folder, optionally as file://."""
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        from src.service.S3StorageService import S3StorageService
+        return S3StorageService(parsed.netloc, parsed.path.strip("/"), endpoint_url, part_size, concurrency)
+    if parsed.scheme in ("", "file"):
+        return LocalStorageService(parsed.path if parsed.scheme else url)
+    raise StorageError(f"Unsupported storage {url}, use s3://bucket/prefix or a folder")
+
+
+def get_storage_key(repository: Repository) -> str:
+    """
+    Key of a repo in the storage, from its link, such as github.com/org/repo. It does not depend on the backup name or
+    the layout of the backup, so unchanged repos are found again by the next backups.
+    """
+    link = urlparse(repository.link)
+    return (link.netloc + link.path).strip("/")
+
+
+def get_content_hash(path: Path) -> Optional[str]:
+    """
+    Hash of the refs of the repo in path and the objects they point to, None if it has no refs. A bundle of all the
+    refs contains exactly the objects reachable from them, so two bundles of the same refs hold the same content.
+    """
+    refs = run_git(["for-each-ref", "--format=%(objectname) %(refname)"], cwd=str(path)).stdout
+    if not refs.strip():
+        return None
+    return hashlib.sha256(refs.encode()).hexdigest()
+
+
+def upload_repository(storage: StorageService, path: Path, key: str) -> Optional[str]:
+    """
+    Streams a bundle of all the refs of the repo in path to storage as <key>/<content hash>.bundle, while git writes
+    it. Repos whose current content is already stored are skipped, so key must identify the repo and not the backup.
+
+    Returns:
+        str: The key of the bundle in the storage, None if the repo is empty.
+
+    Raises:
+        GitTransportError: If the bundle cannot be created.
+        StorageError: If it cannot be uploaded.
+    """
+    content_hash = get_content_hash(path)
+    if content_hash is None:
+        record_upload("empty", 0)
+        return None
+    object_key = f"{key}/{content_hash}.bundle"
+    if storage.exists(object_key):
+        record_upload("skipped", 0)
+        return object_key
+    with span("upload", "storage", path=path, key=object_key):
+        with GitOutputStream(["bundle", "create", "--quiet", "-", "--all"], cwd=str(path)) as stream:
+            size = storage.upload(object_key, stream)
+    record_upload("uploaded", size)
+    return object_key
+
+
+def upload_file(storage: StorageService, path: Path, key: str) -> str:
+    """
+    Uploads the file in path as key, unless it is already stored. The key must change with the content, such as a
+    key with the hash of the file.
+
+    Raises:
+        OSError: If the file cannot be read.
+        StorageError: If it cannot be uploaded.
+    """
+    if storage.exists(key):
+        record_upload("skipped", 0)
+        return key
+    with span("upload", "storage", path=path, key=key), open(path, "rb") as file:
+        size = storage.upload(key, file)
+    record_upload("uploaded", size)
+    return key
+
+
+def get_file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 ** 2), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def submit_upload(storage: StorageService, path: Path, key: str, executor,
+                  upload_function: Callable[[StorageService, Path, str], Optional[str]] = upload_repository) -> Future:
+    """
+    Submits the upload of a repo, or of a file with upload_file, to executor, so that it overlaps with the backup of
+    the next ones. Failures are reported as soon as they happen and raised again by the result of the returned future.
+    """
+    def upload():
+        try:
+            return upload_function(storage, path, key)
+        except Exception as e:
+            print(f"Error: could not upload {path}: {e}")
+            record_upload("failed", 0)
+            raise
+    return executor.submit(upload)
+
+
+def submit_metadata_uploads(storage: StorageService, path: Path, key: str, executor) -> List[Future]:
+    """
+    Submits the uploads of the metadata exported for the repo in path, as <key>.metadata/<kind>/<hash>.ndjson.gz, and
+    of a bundle of its wiki as <key>.wiki/<content hash>.bundle.
+    """
+    futures = []
+    folder = get_metadata_folder(path)
+    if folder.is_dir():
+        for file_path in sorted(folder.glob("*.ndjson.gz")):
+            kind = file_path.name[:-len(".ndjson.gz")]
+            object_key = f"{key}.metadata/{kind}/{get_file_hash(file_path)}.ndjson.gz"
+            futures.append(submit_upload(storage, file_path, object_key, executor, upload_file))
+    if is_git_repository(get_wiki_path(path)):
+        futures.append(submit_upload(storage, get_wiki_path(path), f"{key}.wiki", executor))
+    return futures
+
+
+def submit_lfs_uploads(storage: StorageService, lfs_store: Path, executor) -> List[Future]:
+    """
+    Submits the uploads of the objects of the shared LFS store as lfs/objects/<xx>/<yy>/<oid>, in the layout of the
+    store. The id of an LFS object is the SHA-256 of its content, so the objects already stored are skipped.
+    """
+    lfs_store = Path(lfs_store)
+    objects_folder = lfs_store / "objects"
+    if not objects_folder.is_dir():
+        return []
+    return [submit_upload(storage, object_path, "lfs/" + object_path.relative_to(lfs_store).as_posix(), executor,
+                          upload_file) for object_path in sorted(objects_folder.glob("*/*/*")) if object_path.is_file()]
+
+
+def count_failed_uploads(futures: List[Future]) -> int:
+    """Waits for the uploads submitted with submit_upload and returns how many of them failed."""
+    return sum(1 for future in futures if future.exception() is not None)
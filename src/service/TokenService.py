@@ -18,8 +18,18 @@ def get_gitlab_official_token():
     return get_token("GL_TOKEN")
 
 
+def get_github_official_tokens():
+    return get_tokens("GH_TOKEN")
+
+
+def get_gitlab_official_tokens():
+    return get_tokens("GL_TOKEN")
+
+
 # For GitHub enterprise in example.com its token deduced name would be EXAMPLE_COM_GITHUB
 def deduce_name(provider: ProviderType, hostname: str):
+    # Imported here because ArgumentParserService depends on this module through ProviderService
+    from src.service.ArgumentParserService import infer_name
     return infer_name(hostname).replace('.', '_').capitalize() + "_" + provider.name
 
 
@@ -28,17 +38,22 @@ def get_custom_provider_token(provider: ProviderType, hostname: str):
     return get_token(deduce_name(provider, hostname))
 
 
+def get_custom_provider_tokens(provider: ProviderType, hostname: str):
+    return get_tokens(deduce_name(provider, hostname))
+
+
+def get_secrets_folders():
+    return [
+        "/run/secrets",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "secrets")
+    ]
+
+
 def get_token(token_name):
     """Retrieve a token from predefined sources in order of priority."""
     sources = [
-        lambda: read_file(f"/run/secrets/{token_name}"),
-        lambda: read_file(
-            os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
-                "secrets",
-                token_name
-            ).__str__()
-        ),
+        lambda: read_file(os.path.join(get_secrets_folders()[0], token_name)),
+        lambda: read_file(os.path.join(get_secrets_folders()[1], token_name)),
         lambda: read_env_var(token_name),
     ]
 
@@ -50,3 +65,52 @@ def get_token(token_name):
 
     print(f"Could not read {token_name} from any source")
     sys.exit(1)
+
+
+def find_token(token_name):
+    """Same as get_token, but returns None without complaining if the token is not present in any source."""
+    for secrets_folder in get_secrets_folders():
+        if os.path.exists(os.path.join(secrets_folder, token_name)):
+            try:
+                return read_file(os.path.join(secrets_folder, token_name))
+            except Exception as e:
+                continue
+    if token_name in os.environ:
+        try:
+            return read_env_var(token_name)
+        except Exception as e:
+            pass
+    return None
+
+
+def get_tokens(token_name):
+    """
+    Retrieve the pool of tokens with the given name. The pool is made of the token itself, the numbered tokens
+    token_name_1, token_name_2, ... until the first missing number, and every file in a secrets folder named
+    token_name.d. Duplicated tokens are only returned once.
+    """
+    tokens = []
+    token = find_token(token_name)
+    if token:
+        tokens.append(token)
+
+    index = 1
+    token = find_token(f"{token_name}_{index}")
+    while token:
+        tokens.append(token)
+        index += 1
+        token = find_token(f"{token_name}_{index}")
+
+    for secrets_folder in get_secrets_folders():
+        pool_folder = os.path.join(secrets_folder, token_name + ".d")
+        if os.path.isdir(pool_folder):
+            for file_name in sorted(os.listdir(pool_folder)):
+                try:
+                    tokens.append(read_file(os.path.join(pool_folder, file_name)))
+                except Exception as e:
+                    continue
+
+    if not tokens:
+        print(f"Could not read {token_name} from any source")
+        sys.exit(1)
+    return list(dict.fromkeys(tokens))
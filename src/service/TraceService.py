@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Trace events recorded in the Chrome trace-event format, None while tracing is disabled
+_events = None
+_lock = threading.Lock()
+_thread_ids = {}
+
+
+def start_tracing():
+    global _events
+    _events = []
+
+
+def is_tracing():
+    return _events is not None
+
+
+def _get_track_id(key, name: str):
+    """Returns a small stable id for a thread or worker process, so each of them shows up as its own track."""
+    track_id = _thread_ids.get(key)
+    if track_id is None:
+        with _lock:
+            track_id = len(_thread_ids) + 1
+            _thread_ids[key] = track_id
+            _events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": track_id,
+                            "args": {"name": name}})
+    return track_id
+
+
+def _get_thread_id():
+    return _get_track_id(threading.get_ident(), threading.current_thread().name)
+
+
+@contextmanager
+def span(name: str, category: str = "backup", **args):
+    """Records a complete event spanning the body of the with statement. Does nothing if tracing is disabled."""
+    if _events is None:
+        yield
+        return
+    thread_id = _get_thread_id()
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        end = time.perf_counter_ns()
+        event = {"name": name, "cat": category, "ph": "X", "ts": start / 1000, "dur": (end - start) / 1000,
+                 "pid": os.getpid(), "tid": thread_id}
+        if args:
+            event["args"] = {key: str(value) for key, value in args.items()}
+        with _lock:
+            _events.append(event)
+
+
+def record_span(name: str, category: str, start_ns: int, end_ns: int, track: str, **args):
+    """
+    Records a complete event measured elsewhere, such as in a worker process, with time.perf_counter_ns. The clock is
+    monotonic and shared by all the processes of the machine, so the event lines up with the ones of this process.
+    """
+    if _events is None:
+        return
+    event = {"name": name, "cat": category, "ph": "X", "ts": start_ns / 1000, "dur": (end_ns - start_ns) / 1000,
+             "pid": os.getpid(), "tid": _get_track_id(("track", track), track)}
+    if args:
+        event["args"] = {key: str(value) for key, value in args.items()}
+    with _lock:
+        _events.append(event)
+
+
+def write_trace(file_path: str):
+    """Writes the recorded events as Chrome trace-event JSON, loadable in Perfetto or chrome://tracing."""
+    with _lock:
+        events = list(_events) if _events is not None else []
+    with open(file_path, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
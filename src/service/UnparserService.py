@@ -30,6 +30,39 @@ def print_summary(args):
     if args.produce_json:
         summary.write(f"* JSON summary path:                                                 {args.json_path}\n")
 
+    if args.backup_lfs:
+        summary.write(f"* Git LFS object store:                                              {args.lfs_store}\n")
+
+    if args.export_metadata:
+        summary.write(f"* Metadata export jobs:                                              {args.metadata_jobs}\n")
+
+    if args.storage_url:
+        summary.write(f"* Storage where repositories are uploaded:                           {args.storage_url}\n")
+
+    if args.run_maintenance:
+        summary.write(f"* Maintenance jobs:                                                  {args.maintenance_jobs}\n")
+        if args.maintenance_time_budget:
+            summary.write(f"* Maintenance time budget (seconds):                                 "
+                          f"{args.maintenance_time_budget}\n")
+
+    if args.run_verify:
+        summary.write(f"* Fraction of unchanged packs and refs verified again:               {args.verify_sample}\n")
+
+    if args.plan:
+        summary.write(f"* Plan of the layout of the last discovery, without backing up:      {args.plan}\n")
+
+    if args.metrics_port:
+        summary.write(f"* Prometheus metrics port:                                           {args.metrics_port}\n")
+
+    if args.metrics_textfile:
+        summary.write(f"* Prometheus metrics textfile:                                       {args.metrics_textfile}\n")
+
+    if args.trace_path:
+        summary.write(f"* Chrome trace path:                                                 {args.trace_path}\n")
+
+    if args.profile_path:
+        summary.write(f"* cProfile statistics path:                                          {args.profile_path}\n")
+
     summary.write("* Empty backup folder before performing backup (start from scratch): ")
     summary.write("Yes\n" if args.empty_backup_folder_first else "No\n")
 
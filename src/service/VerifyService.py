@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.service.GitTransportService import GitTransportError, get_git_directory, run_git
+from src.service.IOService import write_json_atomically
+from src.service.MetricsService import record_verification
+from src.service.RepositoryService import find_git_repositories
+from src.service.TraceService import span
+
+# Name of the manifest of the last verified state, kept in the backup folder
+MANIFEST_NAME = ".verify-manifest.json"
+MANIFEST_VERSION = 1
+
+
+class VerifyCheck:
+    """
+    A check of part of a repository.
+
+    kind is "fsck" for a repository that was never verified, "pack" for a single pack and "refs" for the
+    connectivity of some ref tips. A "refs" check walks the objects reachable from targets, stopping at the objects
+    reachable from exclude, which are the tips that were already verified.
+    """
+    def __init__(self, repository: str, path: Path, kind: str, targets: List[str], exclude: List[str] = None):
+        self.repository = repository
+        self.path = path
+        self.kind = kind
+        self.targets = targets
+        self.exclude = exclude if exclude else []
+
+    def __str__(self):
+        return (f"VerifyCheck(repository='{self.repository}', kind='{self.kind}', targets={len(self.targets)}, "
+                f"exclude={len(self.exclude)})")
+
+
+def read_manifest(backup_folder) -> dict:
+    manifest_path = Path(backup_folder) / MANIFEST_NAME
+    if not manifest_path.is_file():
+        return {"version": MANIFEST_VERSION, "repositories": {}}
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    if manifest.get("version") != MANIFEST_VERSION:
+        print(f"Warning: ignoring {manifest_path}, it was written by an incompatible version")
+        return {"version": MANIFEST_VERSION, "repositories": {}}
+    return manifest
+
+
+def write_manifest(backup_folder, manifest: dict):
+    """Replaces the manifest atomically, so an interrupted verification keeps the previous one."""
+    write_json_atomically(Path(backup_folder) / MANIFEST_NAME, manifest)
+
+
+def get_pack_checksums(path: Path) -> Dict[str, str]:
+    """
+    Checksums of the packs of a repository, by pack name. Every pack ends with the SHA-1 (or SHA-256) of its content,
+    so it is read from its last bytes instead of hashing the whole pack. The size is part of the checksum to catch
+    truncated packs.
+    """
+    checksums = {}
+    pack_folder = get_git_directory(path) / "objects" / "pack"
+    if not pack_folder.is_dir():
+        return checksums
+    for entry in os.scandir(pack_folder):
+        if not entry.name.endswith(".pack"):
+            continue
+        size = entry.stat().st_size
+        with open(entry.path, "rb") as file:
+            file.seek(max(size - 20, 0))
+            trailer = file.read(20)
+        checksums[entry.name] = f"{size}:{trailer.hex()}"
+    return checksums
+
+
+def get_ref_tips(path: Path) -> Dict[str, str]:
+    completed = run_git(["for-each-ref", "--format=%(objectname) %(refname)"], cwd=str(path))
+    tips = {}
+    for line in completed.stdout.splitlines():
+        objectname, refname = line.split(" ", 1)
+        tips[refname] = objectname
+    return tips
+
+
+def plan_checks(repository: str, path: Path, entry: Optional[dict], packs: Dict[str, str], refs: Dict[str, str],
+                sample: set) -> List[VerifyCheck]:
+    """
+    Returns the checks needed to verify the current state of a repository, given its entry in the manifest.
+
+    Packs whose checksum is not in the manifest are verified, and so are the refs that moved, from their new tip down
+    to the tips already verified. The unchanged packs and refs in sample are verified as well.
+    """
+    if entry is None:
+        return [VerifyCheck(repository, path, "fsck", [])]
+    checks = []
+    verified_packs = entry.get("packs", {})
+    for name, checksum in sorted(packs.items()):
+        if verified_packs.get(name, {}).get("checksum") != checksum or (repository, "pack", name) in sample:
+            checks.append(VerifyCheck(repository, path, "pack", [name]))
+
+    verified_refs = entry.get("refs", {})
+    changed = [tip for ref, tip in refs.items() if verified_refs.get(ref, {}).get("tip") != tip]
+    unchanged = [tip for ref, tip in refs.items() if verified_refs.get(ref, {}).get("tip") == tip]
+    if changed:
+        checks.append(VerifyCheck(repository, path, "refs", sorted(set(changed)), sorted(set(unchanged))))
+    sampled = [tip for ref, tip in refs.items() if (repository, "ref", ref) in sample]
+    if sampled:
+        checks.append(VerifyCheck(repository, path, "refs", sorted(set(sampled))))
+    return checks
+
+
+def choose_sample(manifest: dict, current: Dict[str, tuple], fraction: float) -> set:
+    """
+    Chooses the unchanged packs and refs to verify again in this run: the fraction of them that were verified the
+    longest ago, with ties broken at random. Every pack and ref is thus verified again at least every 1 / fraction
+    runs, without bursts of work when many were verified in the same run.
+    """
+    candidates = []
+    for repository, (packs, refs) in current.items():
+        entry = manifest["repositories"].get(repository)
+        if entry is None:
+            continue
+        for name, checksum in packs.items():
+            verified = entry.get("packs", {}).get(name)
+            if verified and verified["checksum"] == checksum:
+                candidates.append((verified["verified"], random.random(), (repository, "pack", name)))
+        for ref, tip in refs.items():
+            verified = entry.get("refs", {}).get(ref)
+            if verified and verified["tip"] == tip:
+                candidates.append((verified["verified"], random.random(), (repository, "ref", ref)))
+    candidates.sort()
+    return {key for _, _, key in candidates[:math.ceil(len(candidates) * fraction)]}
+
+
+def run_check(check: VerifyCheck, timeout: Optional[float] = None):
+    """Runs a check, returns the error message if it fails."""
+    git_directory = get_git_directory(check.path)
+    try:
+        with span("verify_" + check.kind, "verify", repository=check.repository, targets=len(check.targets)):
+            if check.kind == "fsck":
+                run_git(["fsck", "--full", "--no-dangling", "--no-progress"], cwd=str(check.path),
+                        timeout=timeout)
+            elif check.kind == "pack":
+                # Inflates every object of the pack and checks it against its id and the pack checksum
+                index = git_directory / "objects" / "pack" / (check.targets[0][:-len(".pack")] + ".idx")
+                run_git(["verify-pack", str(index)], cwd=str(check.path), timeout=timeout)
+            else:
+                # Tips are passed through stdin, there can be too many for the command line
+                run_git(["rev-list", "--objects", "--quiet", "--stdin"], cwd=str(check.path), timeout=timeout,
+                        input="".join(f"{tip}\n" for tip in check.targets)
+                        + "".join(f"^{tip}\n" for tip in check.exclude))
+    except GitTransportError as e:
+        return str(e)
+    return None
+
+
+def verify_backup(backup_folder, jobs: Optional[int] = None, sample_fraction: float = 0.1,
+                  timeout: Optional[float] = None) -> int:
+    """
+    Verifies the repositories under backup_folder against the manifest of the last verification, and updates it.
+
+    Repositories never verified are checked with git fsck. For the others only the packs and refs that changed since
+    they were last verified are checked, plus a rotating sample of sample_fraction of the unchanged ones. The checks
+    run jobs at a time. A repository with any failed check keeps its previous manifest entry, so it is checked again
+    by the next run.
+
+    Returns:
+        int: Number of repositories that failed verification.
+    """
+    backup_folder = Path(backup_folder)
+    manifest = read_manifest(backup_folder)
+    current = {}
+    paths = {}
+    failed = set()
+    for path in find_git_repositories(backup_folder):
+        repository = path.relative_to(backup_folder).as_posix()
+        paths[repository] = path
+        try:
+            current[repository] = (get_pack_checksums(path), get_ref_tips(path))
+        except (GitTransportError, OSError) as e:
+            # Such as a corrupt HEAD or an unreadable pack, the repository fails without stopping the others
+            print(f"Error: could not read the state of {path}: {e}")
+            record_verification("refs", "failed")
+            failed.add(repository)
+
+    sample = choose_sample(manifest, current, sample_fraction)
+    checks = []
+    for repository, (packs, refs) in current.items():
+        checks.extend(plan_checks(repository, paths[repository], manifest["repositories"].get(repository), packs,
+                                  refs, sample))
+
+    with ThreadPoolExecutor(max_workers=jobs if jobs else os.cpu_count(), thread_name_prefix="verify") as executor:
+        errors = list(executor.map(lambda check: run_check(check, timeout), checks))
+
+    for check, error in zip(checks, errors):
+        record_verification(check.kind, "failed" if error else "passed")
+        if error:
+            print(f"Error: verification of {check.repository} failed: {error}")
+            failed.add(check.repository)
+
+    now = time.time()
+    repositories = {}
+    for repository in failed:
+        previous = manifest["repositories"].get(repository)
+        if previous is not None:
+            repositories[repository] = previous
+    for repository, (packs, refs) in current.items():
+        if repository in failed:
+            continue
+        previous = manifest["repositories"].get(repository)
+        previous_packs = previous.get("packs", {}) if previous else {}
+        previous_refs = previous.get("refs", {}) if previous else {}
+        # Only the packs and refs verified by this run get its time, the rest keep the time they were verified at
+        repositories[repository] = {
+            "packs": {name: previous_packs[name] if previous_packs.get(name, {}).get("checksum") == checksum
+                      and (repository, "pack", name) not in sample else {"checksum": checksum, "verified": now}
+                      for name, checksum in packs.items()},
+            "refs": {ref: previous_refs[ref] if previous_refs.get(ref, {}).get("tip") == tip
+                     and (repository, "ref", ref) not in sample else {"tip": tip, "verified": now}
+                     for ref, tip in refs.items()},
+        }
+    manifest["repositories"] = repositories
+    write_manifest(backup_folder, manifest)
+
+    print(f"Verified {len(paths)} repositories with {len(checks)} checks, {len(failed)} failed")
+    return len(failed)
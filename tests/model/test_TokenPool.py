@@ -0,0 +1,39 @@
+import time
+
+from src.model.TokenPool import TokenPool
+
+
+def test_acquire_counts_calls_of_tokens_with_unknown_budget():
+    pool = TokenPool(["a", "b"])
+    token = pool.acquire()
+    assert token in pool.tokens
+    assert token.calls == 1
+
+
+def test_acquire_prefers_the_token_with_most_remaining_budget():
+    pool = TokenPool(["a", "b", "c"])
+    a, b, c = pool.tokens
+    reset = time.time() + 3600
+    pool.update(a, 10, 5000, reset)
+    pool.update(b, 4000, 5000, reset)
+    pool.update(c, 200, 5000, reset)
+    assert pool.acquire() is b
+    assert b.calls == 1
+
+
+def test_acquire_skips_exhausted_tokens_until_their_reset():
+    pool = TokenPool(["a", "b"])
+    a, b = pool.tokens
+    pool.update(a, 0, 5000, time.time() + 3600)
+    pool.update(b, 1, 5000, time.time() + 3600)
+    assert pool.acquire() is b
+    pool.update(b, 0, 5000, time.time() + 60)
+    assert pool.acquire() is None
+    assert pool.next_reset() == b.reset
+
+
+def test_exhausted_token_is_available_again_after_its_reset():
+    pool = TokenPool(["a"])
+    a, = pool.tokens
+    pool.update(a, 0, 5000, time.time() - 1)
+    assert pool.acquire() is a
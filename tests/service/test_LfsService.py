@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from src.service.LfsService import get_object_path, plan_lfs_fetches
+
+A = "a" * 64
+B = "b" * 64
+C = "c" * 64
+
+
+def store_object(store, oid):
+    object_path = get_object_path(store, oid)
+    object_path.parent.mkdir(parents=True)
+    object_path.write_bytes(b"lfs")
+
+
+def test_shared_objects_are_fetched_by_the_first_wave_only(tmp_path):
+    first_wave, second_wave = plan_lfs_fetches({Path("small"): {A}, Path("large"): {A, B}, Path("other"): {C}},
+                                               tmp_path)
+    assert first_wave == [Path("large"), Path("other")]
+    assert second_wave == [Path("small")]
+
+
+def test_objects_already_in_the_store_are_not_fetched(tmp_path):
+    store_object(tmp_path, A)
+    first_wave, second_wave = plan_lfs_fetches({Path("done"): {A}, Path("partial"): {A, B}, Path("empty"): set()},
+                                               tmp_path)
+    assert first_wave == [Path("partial")]
+    assert second_wave == []
@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from src.service.MaintenanceService import RepositoryState, get_priority, plan_maintenance
+
+
+def build_state(packs=1, loose_objects=0, is_commit_graph_outdated=False, has_multi_pack_index=False):
+    return RepositoryState(Path("repo"), packs, loose_objects, is_commit_graph_outdated, has_multi_pack_index)
+
+
+def test_nothing_to_do_for_a_compact_repository():
+    assert plan_maintenance(build_state()) == []
+
+
+def test_outdated_commit_graph_alone():
+    assert plan_maintenance(build_state(is_commit_graph_outdated=True)) == ["commit-graph"]
+
+
+def test_loose_objects_and_packs_are_repacked_incrementally():
+    assert plan_maintenance(build_state(packs=12, loose_objects=500, has_multi_pack_index=True)) == \
+        ["loose-objects", "incremental-repack", "commit-graph"]
+
+
+def test_several_packs_without_multi_pack_index_are_repacked():
+    assert plan_maintenance(build_state(packs=2)) == ["incremental-repack", "commit-graph"]
+    assert plan_maintenance(build_state(packs=2, has_multi_pack_index=True)) == []
+
+
+def test_very_fragmented_repository_gets_a_full_gc():
+    assert plan_maintenance(build_state(packs=51)) == ["gc"]
+    assert plan_maintenance(build_state(loose_objects=6701)) == ["gc"]
+
+
+def test_limits_can_be_lowered():
+    assert plan_maintenance(build_state(loose_objects=5), loose_objects_limit=1) == ["loose-objects", "commit-graph"]
+
+
+def test_most_fragmented_first():
+    assert get_priority(build_state(packs=20)) > get_priority(build_state(packs=2, loose_objects=100))
@@ -0,0 +1,58 @@
+import gzip
+from pathlib import Path
+
+from src.defines.ProviderType import ProviderType
+from src.model.Provider import Provider
+from src.model.Repository import Repository
+from src.service.MetadataExportService import export_metadata, read_cursors
+
+PROVIDER = Provider(ProviderType.GITHUB, "https://github.com", None)
+
+
+class IssuesService:
+    def __init__(self, issues):
+        self.issues = issues
+        self.requests = []
+
+    def get_metadata_kinds(self):
+        return ["issues"]
+
+    def get_metadata_pages(self, organization, name, kind, since):
+        self.requests.append(since)
+        yield [issue for issue in self.issues if since is None or issue["updated_at"] >= since]
+
+    def get_wiki_url(self, organization, name):
+        return None
+
+
+def build_model(backup_name, users):
+    return {Path(backup_name, user, "org", "r"): Repository(backup_name, user, PROVIDER, "org", "r",
+                                                           "https://github.com/org/r") for user in users}
+
+
+def read_lines(path):
+    with gzip.open(path, "rt") as file:
+        return file.read().splitlines()
+
+
+def test_exports_into_a_new_backup_only_fetch_what_changed(tmp_path):
+    service = IssuesService([{"id": 1, "updated_at": "2024-01-01T00:00:00Z"}])
+    export_metadata(build_model("first", ["alice"]), tmp_path, {PROVIDER: service})
+    service.issues.append({"id": 2, "updated_at": "2024-01-02T00:00:00Z"})
+    export_metadata(build_model("second", ["alice", "bob"]), tmp_path, {PROVIDER: service})
+
+    assert service.requests == [None, "2024-01-01T00:00:00Z"]
+    for user in ["alice", "bob"]:
+        assert len(read_lines(tmp_path / "second" / user / "org" / "r.metadata" / "issues.ndjson.gz")) == 2
+    assert len(read_lines(tmp_path / "first" / "alice" / "org" / "r.metadata" / "issues.ndjson.gz")) == 1
+    assert read_cursors(tmp_path) == {"https://github.com/org/r": {
+        "path": "second/alice/org/r", "kinds": {"issues": {"since": "2024-01-02T00:00:00Z", "ids": [2]}}}}
+
+
+def test_cursors_of_repositories_not_in_the_model_are_dropped(tmp_path):
+    service = IssuesService([])
+    export_metadata(build_model("first", ["alice"]), tmp_path, {PROVIDER: service})
+    other = {Path("first", "alice", "org", "s"): Repository("first", "alice", PROVIDER, "org", "s",
+                                                           "https://github.com/org/s")}
+    export_metadata(other, tmp_path, {PROVIDER: service})
+    assert list(read_cursors(tmp_path)) == ["https://github.com/org/s"]
@@ -0,0 +1,28 @@
+from src.service.PlanService import diff_layout, get_plan_folders
+
+
+def test_diff_layout():
+    planned = {"new": "link/new", "same": "link/same", "moved": "link/moved"}
+    on_disk = ["same", "old", "gone", "same.wiki", "gone.wiki"]
+    previous = {"link/moved": "old", "link/same": "same"}
+    added, moved, removed, unchanged = diff_layout(planned, on_disk, previous)
+    assert added == ["new"]
+    assert moved == [("old", "moved")]
+    # Wikis are cloned next to their repository and follow it
+    assert removed == ["gone"]
+    assert unchanged == 1
+
+
+def test_diff_layout_does_not_move_a_path_that_is_still_planned():
+    planned = {"a": "link/b", "b": "link/a"}
+    added, moved, removed, unchanged = diff_layout(planned, ["a"], {"link/b": "b", "link/a": "a"})
+    assert (added, moved, removed, unchanged) == (["b"], [], [], 1)
+
+
+def test_plan_folders():
+    assert get_plan_folders("2024-01-01", None, []) == ["2024-01-01"]
+    assert get_plan_folders("2024-01-01", ["alice", "bob"], []) == ["2024-01-01/alice", "2024-01-01/bob"]
+    assert get_plan_folders("2024-01-01", ["alice"], ["USER"]) == ["2024-01-01"]
+    # Without a folder per backup, the repos of the backup can be anywhere in the backup folder
+    assert get_plan_folders("2024-01-01", None, ["ROOT"]) == [""]
+    assert get_plan_folders("2024-01-01", ["alice"], ["ROOT"]) == ["alice"]
@@ -0,0 +1,97 @@
+from pathlib import Path
+
+from src.defines.ProviderType import ProviderType
+from src.defines.RenameStrategy import RenameStrategy
+from src.model.Provider import Provider
+from src.model.Repository import Repository
+from src.service.RepositoryService import resolve_path_names, resolve_paths
+
+GITHUB = Provider(ProviderType.GITHUB, "https://github.com", None)
+GITLAB = Provider(ProviderType.GITLAB, "https://gitlab.com", None)
+FLATTEN_ALL = ["ROOT", "USER", "PROVIDER", "ORGANIZATION"]
+
+
+def build_repository(organization, name, provider=GITHUB, owner="user"):
+    return Repository("backup", owner, provider, organization, name, f"{provider.url}/{organization}/{name}")
+
+
+def resolve(repositories, strategy, flatten_directories=FLATTEN_ALL):
+    model, skipped = resolve_path_names(repositories, flatten_directories, strategy)
+    return {path: repository.link for path, repository in model.items()}, [repository.link for repository in skipped]
+
+
+def test_hierarchy_without_collisions():
+    model, skipped = resolve([build_repository("org", "a"), build_repository("org", "b", GITLAB)],
+                             RenameStrategy.SHORTEST_SYSTEMATIC, [])
+    assert model == {"backup/user/GITHUB/org/a": "https://github.com/org/a",
+                     "backup/user/GITLAB/org/b": "https://gitlab.com/org/b"}
+    assert skipped == []
+
+
+def test_ignore_keeps_the_first_of_three():
+    model, skipped = resolve([build_repository("a", "r"), build_repository("b", "r"), build_repository("c", "r")],
+                             RenameStrategy.IGNORE)
+    assert model == {"r": "https://github.com/a/r"}
+    assert skipped == ["https://github.com/b/r", "https://github.com/c/r"]
+
+
+def test_shortest_renames_all_but_the_first_of_three():
+    model, skipped = resolve([build_repository("a", "r"), build_repository("b", "r"), build_repository("c", "r")],
+                             RenameStrategy.SHORTEST)
+    assert model == {"r": "https://github.com/a/r", "r__b": "https://github.com/b/r", "r__c": "https://github.com/c/r"}
+    assert skipped == []
+
+
+def test_shortest_goes_up_until_the_name_is_free():
+    model, _ = resolve([build_repository("a", "r"), build_repository("a", "r", GITLAB),
+                        build_repository("a", "r", owner="other")], RenameStrategy.SHORTEST)
+    assert list(model) == ["r", "r__a", "r__a__GITHUB"]
+    assert model["r__a"] == "https://gitlab.com/a/r"
+
+
+def test_shortest_never_takes_the_path_of_a_repository_without_collision():
+    model, _ = resolve([build_repository("a", "r"), build_repository("b", "r"), build_repository("c", "r__b")],
+                       RenameStrategy.SHORTEST)
+    assert model == {"r": "https://github.com/a/r", "r__b__GITHUB": "https://github.com/b/r",
+                     "r__b": "https://github.com/c/r__b"}
+
+
+def test_systematic_gives_the_full_name_to_all_of_three():
+    model, skipped = resolve([build_repository("a", "r"), build_repository("b", "r"), build_repository("c", "r"),
+                              build_repository("a", "other")], RenameStrategy.SYSTEMATIC)
+    assert model == {"r__a__GITHUB__user__backup": "https://github.com/a/r",
+                     "r__b__GITHUB__user__backup": "https://github.com/b/r",
+                     "r__c__GITHUB__user__backup": "https://github.com/c/r",
+                     "other": "https://github.com/a/other"}
+    assert skipped == []
+
+
+def test_shortest_systematic_renames_all_of_three_at_the_same_level():
+    model, _ = resolve([build_repository("a", "r"), build_repository("b", "r"), build_repository("a", "r", GITLAB)],
+                       RenameStrategy.SHORTEST_SYSTEMATIC)
+    assert model == {"r__a__GITHUB": "https://github.com/a/r", "r__b__GITHUB": "https://github.com/b/r",
+                     "r__a__GITLAB": "https://gitlab.com/a/r"}
+
+
+def test_collision_across_users():
+    repositories = [build_repository("org", "r", owner="alice"), build_repository("org", "r", owner="bob")]
+    model, _ = resolve(repositories, RenameStrategy.SHORTEST_SYSTEMATIC)
+    assert set(model) == {"r__org__GITHUB__alice", "r__org__GITHUB__bob"}
+    model, _ = resolve(repositories, RenameStrategy.SHORTEST)
+    assert set(model) == {"r", "r__org"}
+    # Not flattening the users keeps them apart
+    model, _ = resolve(repositories, RenameStrategy.SHORTEST_SYSTEMATIC, ["ROOT", "PROVIDER", "ORGANIZATION"])
+    assert set(model) == {"alice/r", "bob/r"}
+
+
+def test_duplicates_are_skipped():
+    model, skipped = resolve([build_repository("a", "r"), build_repository("a", "r")], RenameStrategy.SYSTEMATIC)
+    assert model == {"r__a__GITHUB__user__backup": "https://github.com/a/r"}
+    assert skipped == ["https://github.com/a/r"]
+
+
+def test_resolve_paths_sets_the_path_of_each_repository():
+    model, _ = resolve_paths([build_repository("a", "r"), build_repository("b", "r")], ["ROOT"],
+                             RenameStrategy.SHORTEST_SYSTEMATIC)
+    assert set(model) == {Path("user/GITHUB/a/r"), Path("user/GITHUB/b/r")}
+    assert all(repository.path == path for path, repository in model.items())
@@ -0,0 +1,39 @@
+import subprocess
+
+from src.service.RestoreService import deduplicate_repositories, find_target_collisions, select_repositories
+
+
+def build_entry(organization, name, status="cloned", user="user"):
+    return {"path": f"{organization}/{name}", "user": user, "provider": "GITHUB", "organization": organization,
+            "name": name, "link": f"https://github.com/{organization}/{name}", "status": status}
+
+
+def test_repositories_on_disk_are_selected_whatever_their_last_status(tmp_path):
+    for path in ["org/cloned", "org/fetch-failed"]:
+        subprocess.run(["git", "init", "--quiet", str(tmp_path / path)], check=True)
+    entries = [build_entry("org", "cloned"), build_entry("org", "fetch-failed", "failed"),
+               build_entry("org", "never-cloned", "failed")]
+    selected = select_repositories(entries, tmp_path)
+    assert [entry["name"] for entry in selected] == ["cloned", "fetch-failed"]
+
+
+def test_selection_criteria(tmp_path):
+    entries = [build_entry("a", "x"), build_entry("a", "y", user="other"), build_entry("b", "x")]
+    for entry in entries:
+        subprocess.run(["git", "init", "--quiet", str(tmp_path / entry["path"])], check=True)
+    assert select_repositories(entries, tmp_path, users=["user"], organizations=["a"]) == [entries[0]]
+    assert select_repositories(entries, tmp_path, globs=["*/x"]) == [entries[0], entries[2]]
+
+
+def test_repositories_backed_up_for_several_users_are_restored_once():
+    entries = [build_entry("org", "r", user="alice"), build_entry("org", "r", user="bob"), build_entry("org", "s")]
+    assert deduplicate_repositories(entries) == [entries[0], entries[2]]
+
+
+def test_different_repositories_with_the_same_target_collide():
+    entries = [build_entry("org", "r"), dict(build_entry("org", "r"), link="https://gitlab.com/org/r"),
+               build_entry("org", "s")]
+    targets = ["org/r", "org/r", "org/s"]
+    assert find_target_collisions(entries, targets) == {"org/r": ["https://github.com/org/r",
+                                                                   "https://gitlab.com/org/r"]}
+    assert find_target_collisions(entries, ["a", "b", "c"]) == {}
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.defines.ProviderType import ProviderType
+from src.model.Provider import Provider
+from src.model.Repository import Repository
+from src.service.StorageService import LocalStorageService, count_failed_uploads, get_storage_key, \
+    submit_lfs_uploads, submit_metadata_uploads
+
+PROVIDER = Provider(ProviderType.GITHUB, "http://127.0.0.1:8080", None)
+
+
+def test_storage_key_does_not_depend_on_the_backup():
+    first = Repository("2024-01-01T00:00:00", "alice", PROVIDER, "org", "r", "http://127.0.0.1:8080/org/r")
+    second = Repository("2024-01-02T00:00:00", "bob", PROVIDER, "org", "r", "http://127.0.0.1:8080/org/r")
+    assert get_storage_key(first) == get_storage_key(second) == "127.0.0.1:8080/org/r"
+
+
+def test_lfs_objects_are_uploaded_once(tmp_path):
+    oid = "ab" + "c" * 62
+    object_path = tmp_path / "store" / "objects" / "ab" / "cc" / oid
+    object_path.parent.mkdir(parents=True)
+    object_path.write_bytes(b"lfs")
+    storage = LocalStorageService(tmp_path / "storage")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        futures = submit_lfs_uploads(storage, tmp_path / "store", executor)
+        futures += submit_lfs_uploads(storage, tmp_path / "store", executor)
+    assert count_failed_uploads(futures) == 0
+    assert [future.result() for future in futures] == [f"lfs/objects/ab/cc/{oid}"] * 2
+    assert (tmp_path / "storage" / "lfs" / "objects" / "ab" / "cc" / oid).read_bytes() == b"lfs"
+
+
+def test_metadata_is_uploaded_by_content(tmp_path):
+    metadata_folder = tmp_path / "backup" / "r.metadata"
+    metadata_folder.mkdir(parents=True)
+    (metadata_folder / "issues.ndjson.gz").write_bytes(b"first")
+    storage = LocalStorageService(tmp_path / "storage")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        first = [future.result() for future in submit_metadata_uploads(storage, tmp_path / "backup" / "r", "h/o/r",
+                                                                       executor)]
+        (metadata_folder / "issues.ndjson.gz").write_bytes(b"first and second")
+        second = [future.result() for future in submit_metadata_uploads(storage, tmp_path / "backup" / "r", "h/o/r",
+                                                                        executor)]
+    assert len(first) == len(second) == 1
+    assert first[0].startswith("h/o/r.metadata/issues/") and first[0] != second[0]
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+from src.service.VerifyService import choose_sample, plan_checks
+
+PATH = Path("repo")
+
+
+def build_entry(packs, refs, verified=0):
+    return {"packs": {name: {"checksum": checksum, "verified": verified} for name, checksum in packs.items()},
+            "refs": {ref: {"tip": tip, "verified": verified} for ref, tip in refs.items()}}
+
+
+def describe(checks):
+    return [(check.kind, check.targets, check.exclude) for check in checks]
+
+
+def test_never_verified_repository_gets_a_full_fsck():
+    assert describe(plan_checks("repo", PATH, None, {"a.pack": "1"}, {"refs/heads/main": "t1"}, set())) == \
+        [("fsck", [], [])]
+
+
+def test_unchanged_repository_needs_no_check():
+    entry = build_entry({"a.pack": "1"}, {"refs/heads/main": "t1"})
+    assert plan_checks("repo", PATH, entry, {"a.pack": "1"}, {"refs/heads/main": "t1"}, set()) == []
+
+
+def test_new_packs_and_moved_refs_are_checked_down_to_the_verified_tips():
+    entry = build_entry({"a.pack": "1"}, {"refs/heads/main": "t1", "refs/heads/dev": "t2"})
+    checks = plan_checks("repo", PATH, entry, {"a.pack": "1", "b.pack": "2"},
+                         {"refs/heads/main": "t3", "refs/heads/dev": "t2"}, set())
+    assert describe(checks) == [("pack", ["b.pack"], []), ("refs", ["t3"], ["t2"])]
+
+
+def test_rewritten_pack_is_checked_again():
+    entry = build_entry({"a.pack": "1"}, {})
+    assert describe(plan_checks("repo", PATH, entry, {"a.pack": "changed"}, {}, set())) == [("pack", ["a.pack"], [])]
+
+
+def test_sampled_packs_and_refs_are_checked_again():
+    entry = build_entry({"a.pack": "1"}, {"refs/heads/main": "t1"})
+    sample = {("repo", "pack", "a.pack"), ("repo", "ref", "refs/heads/main")}
+    assert describe(plan_checks("repo", PATH, entry, {"a.pack": "1"}, {"refs/heads/main": "t1"}, sample)) == \
+        [("pack", ["a.pack"], []), ("refs", ["t1"], [])]
+
+
+def test_sample_takes_the_fraction_verified_the_longest_ago():
+    manifest = {"repositories": {
+        "old": build_entry({"a.pack": "1"}, {"refs/heads/main": "t1"}, verified=10),
+        "new": build_entry({"b.pack": "2"}, {"refs/heads/main": "t2"}, verified=20),
+    }}
+    current = {"old": ({"a.pack": "1"}, {"refs/heads/main": "t1"}),
+               "new": ({"b.pack": "2"}, {"refs/heads/main": "t2"})}
+    assert choose_sample(manifest, current, 0.5) == {("old", "pack", "a.pack"), ("old", "ref", "refs/heads/main")}
+    assert len(choose_sample(manifest, current, 1)) == 4
+    assert choose_sample(manifest, current, 0) == set()
+
+
+def test_sample_skips_changed_and_never_verified_objects():
+    manifest = {"repositories": {"repo": build_entry({"a.pack": "1"}, {"refs/heads/main": "t1"})}}
+    current = {"repo": ({"a.pack": "changed"}, {"refs/heads/main": "t1"}), "other": ({"b.pack": "2"}, {})}
+    assert choose_sample(manifest, current, 1) == {("repo", "ref", "refs/heads/main")}